@@ -0,0 +1,153 @@
+"""Matching a transcribed answer against the accepted answers of a dialogue line.
+
+Both sides are normalized to one canonical spelling first, so "6:45 pm" and "six forty-five
+p.m.", "3rd" and "third", or "you are" and "you're" compare as equal instead of costing
+the learner a retry (and the app a full TTS + STT round-trip).
+"""
+import re
+
+from thefuzz import fuzz
+
+# Bump whenever normalize() output changes: scenario packs store pre-normalized answers
+# tagged with this version, and stale ones are recomputed on load
+NORMALIZER_VERSION = 2
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70,
+    "eighty": 80, "ninety": 90,
+}
+ORDINAL_UNITS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7,
+    "eighth": 8, "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13,
+    "fourteenth": 14, "fifteenth": 15, "sixteenth": 16, "seventeenth": 17, "eighteenth": 18,
+    "nineteenth": 19,
+}
+ORDINAL_TENS = {
+    "twentieth": 20, "thirtieth": 30, "fortieth": 40, "fiftieth": 50, "sixtieth": 60,
+    "seventieth": 70, "eightieth": 80, "ninetieth": 90,
+}
+SCALES = {"hundred": 100, "thousand": 1000}
+
+# 's is ambiguous (is / has / possessive), so it is only expanded after these words
+CONTRACTIONS = {
+    "it's": "it is", "that's": "that is", "he's": "he is", "she's": "she is", "there's": "there is",
+    "what's": "what is", "where's": "where is", "who's": "who is", "here's": "here is",
+    "let's": "let us", "can't": "can not", "cannot": "can not", "won't": "will not", "shan't": "shall not",
+    "ain't": "is not",
+}
+CONTRACTION_SUFFIXES = [("n't", " not"), ("'re", " are"), ("'ve", " have"), ("'ll", " will"),
+                        ("'m", " am"), ("'d", " would")]
+
+ABBREVIATIONS = {"mr": "mister", "mrs": "missus", "dr": "doctor", "okay": "ok", "plz": "please"}
+FILLERS = {"um", "umm", "uh", "uhh", "er", "erm", "hmm", "mm"}
+
+# Words that flip the meaning of an answer while changing only a few characters of it
+NEGATIONS = {"no", "not", "never", "nothing", "none", "nobody", "nowhere", "neither", "nor",
+             "without", "nope", "nah"}
+# Highest score an answer can get when its negations differ from the expected answer's
+NEGATION_MISMATCH_CAP = 50
+
+
+def _expand_contraction(word):
+    if word in CONTRACTIONS:
+        return CONTRACTIONS[word]
+    for suffix, expansion in CONTRACTION_SUFFIXES:
+        if word.endswith(suffix) and len(word) > len(suffix):
+            return word[:-len(suffix)] + expansion
+    return word
+
+
+def _words_to_numbers(tokens):
+    """Rewrites spelled-out cardinals and ordinals as digits: "six forty five" -> "6 45"."""
+    out = []
+    value = None
+    last = None  # kind of the previous number word: "unit", "tens" or "scale"
+
+    def flush():
+        nonlocal value, last
+        if value is not None:
+            out.append(str(value))
+        value, last = None, None
+
+    for token in tokens:
+        unit = UNITS.get(token, ORDINAL_UNITS.get(token))
+        tens = TENS.get(token, ORDINAL_TENS.get(token))
+        if unit is not None:
+            if value is not None and ((last == "tens" and unit < 10) or last == "scale"):
+                value += unit
+            else:
+                flush()
+                value = unit
+            last = "unit"
+        elif tens is not None:
+            if value is not None and last == "scale":
+                value += tens
+            else:
+                flush()
+                value = tens
+            last = "tens"
+        elif token in SCALES and value is not None:
+            value *= SCALES[token]
+            last = "scale"
+        else:
+            flush()
+            out.append(token)
+        if token in ORDINAL_UNITS or token in ORDINAL_TENS:
+            flush()  # an ordinal always ends the number
+    flush()
+    return out
+
+
+def normalize(text):
+    """Canonical form of an answer: lowercase, no punctuation, expanded contractions,
+    digits for numbers and ordinals, "6 45 pm" for times."""
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"\bo'?clock\b", " ", text)
+    text = re.sub(r"\b([ap])\.\s?m\b\.?", r"\1m", text)      # p.m. / a.m.
+    text = re.sub(r"(\d)\s?(am|pm)\b", r"\1 \2", text)        # 6pm
+    text = re.sub(r"\b(\d{1,2}):00\b", r"\1", text)           # 6:00 -> 6
+    text = re.sub(r"\b(\d{1,2}):(\d{2})\b", r"\1 \2", text)   # 6:45 -> 6 45
+    text = re.sub(r"\b(\d+)(st|nd|rd|th)\b", r"\1", text)     # 3rd -> 3
+    text = " ".join(_expand_contraction(word) for word in text.split())
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    tokens = [ABBREVIATIONS.get(t, t) for t in text.split() if t not in FILLERS]
+    return " ".join(_words_to_numbers(tokens))
+
+
+def accepted_answers(line):
+    """Normalized forms of every accepted answer of a dialogue line ("user" plus "accept")."""
+    answers = [line["user"]] + list(line.get("accept", []))
+    return list(dict.fromkeys(normalize(answer) for answer in answers))
+
+
+def _negations(text):
+    return NEGATIONS.intersection(text.split())
+
+
+def _score(user, answer):
+    # Plain ratio keeps word order: "welcome you are" is not "you are welcome"
+    score = fuzz.ratio(user, answer)
+    if len(user) > len(answer):
+        # The whole answer said inside a longer utterance ("yes please thank you"); a little
+        # below a plain match so extra words still cost something
+        score = max(score, fuzz.partial_ratio(answer, user) - 5)
+    if _negations(user) != _negations(answer):
+        # "I am not hungry" is the opposite of "I am hungry", however close the spelling
+        score = min(score, NEGATION_MISMATCH_CAP)
+    return score
+
+
+def best_match(user_text, answers):
+    """Scores a transcript against all normalized answers in one pass.
+
+    Returns (score 0-100, best answer); (0, None) for an empty transcript.
+    """
+    user = normalize(user_text or "")
+    if not user or not answers:
+        return 0, None
+    return max((_score(user, answer), answer) for answer in answers)
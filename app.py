@@ -1,113 +1,1105 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # process start, for the cold-start measurements
+
 import flet as ft
 import asyncio
-import edge_tts
-import speech_recognition as sr
-import whisper
 import os
-import tempfile
-import pygame
 import warnings
 import random
-from thefuzz import fuzz
+import io
+import base64
+import sys
+import hashlib
+import argparse
+import json
+from collections import OrderedDict, deque
+from answer_matching import best_match, normalize
+from stt_worker import STTWorker
+from audio_capture import ContinuousCapture, Utterance, SAMPLE_RATE, decode_wav
+from scenario_packs import ScenarioLibrary
+from tracing import Tracer
+import web_server
 
 # --- CONFIGURATION & DATA ---
-STT_MODEL_SIZE = "base"
+# Speech-to-text engine, model and decode profile; see stt_backends.py for the choices
+STT_ENGINE = os.environ.get("STT_ENGINE", "whisper")
+STT_MODEL_SIZE = os.environ.get("STT_MODEL_SIZE", "base")
+STT_PROFILE = os.environ.get("STT_PROFILE", "accurate")
+# Whisper runs in a separate worker process; leave a core free for the UI
+STT_TORCH_THREADS = max(1, (os.cpu_count() or 2) - 1)
+STT_INTEROP_THREADS = 1
+# A transcription may take STT_TIMEOUT_BASE s plus STT_TIMEOUT_PER_SECOND s per second of audio
+# queued up to it (at most STT_REQUEST_TIMEOUT) before the worker is taken for hung and
+# restarted; an idle worker is pinged every STT_HEALTH_INTERVAL s. Raise the per-second budget
+# for models slower than real time on this CPU.
+STT_REQUEST_TIMEOUT = 60.0
+STT_TIMEOUT_BASE = 5.0
+STT_TIMEOUT_PER_SECOND = 2.0
+STT_HEALTH_INTERVAL = 10.0
+# Dynamic batching in the worker: concurrent answers arriving within STT_BATCH_WINDOW s of each
+# other are decoded together (up to STT_MAX_BATCH), unless waiting would push the oldest past
+# STT_LATENCY_SLO s. A lone desktop learner gains nothing from waiting, so the window is only
+# opened in server mode unless set explicitly.
+STT_BATCH_WINDOW = float(os.environ.get("STT_BATCH_WINDOW", "0"))
+STT_SERVER_BATCH_WINDOW = 0.05
+STT_MAX_BATCH = 8
+STT_LATENCY_SLO = 1.5
+# Cascade (off unless STT_CASCADE_MODEL is set, e.g. "tiny"): answers are first transcribed by
+# that smaller model and only re-run on STT_MODEL_SIZE when its average log-probability is
+# below STT_CASCADE_MIN_LOGPROB or it matches the expected line below STT_CASCADE_MIN_SCORE
+STT_CASCADE_MODEL = os.environ.get("STT_CASCADE_MODEL") or None
+if STT_CASCADE_MODEL == STT_MODEL_SIZE:
+    # Both stages would be the same model: every answer decoded twice, with nothing to gain
+    print(f"STT_CASCADE_MODEL is the main model ({STT_MODEL_SIZE}); cascade disabled")
+    STT_CASCADE_MODEL = None
+STT_CASCADE_MIN_LOGPROB = float(os.environ.get("STT_CASCADE_MIN_LOGPROB", "-0.5"))
+STT_CASCADE_MIN_SCORE = int(os.environ.get("STT_CASCADE_MIN_SCORE", "85"))
+# Microphone: wait up to LISTEN_TIMEOUT s for speech to start, cut answers at LISTEN_MAX_DURATION s,
+# and end an answer after LISTEN_TRAILING_SILENCE s of silence
+LISTEN_TIMEOUT = 5.0
+LISTEN_MAX_DURATION = 8.0
+LISTEN_TRAILING_SILENCE = 0.7
+# Streaming recognition: while the learner speaks, re-transcribe the growing answer every
+# PARTIAL_INTERVAL s (once it has grown by PARTIAL_MIN_GROWTH s) and end the turn early as soon
+# as it matches the expected line with at least EARLY_ACCEPT_SCORE (well above the 80% pass mark)
+STREAMING_RECOGNITION = True
+PARTIAL_INTERVAL = 0.8
+PARTIAL_MIN_GROWTH = 0.5
+EARLY_ACCEPT_SCORE = 90
 VOICE = "en-US-AriaNeural"
+TTS_RATE = "+0%"
+TTS_PITCH = "+0Hz"
+# Optional HTTP endpoint that replaces edge-tts (e.g. bench/tts_standin.py); streams mp3 for ?text=...
+TTS_ENDPOINT = os.environ.get("TTS_ENDPOINT")
 warnings.filterwarnings("ignore")
 
-# Scenario Data
-SCENARIOS = {
-    "train": {
-        "title": "Train Inquiry",
-        "icon": "train",
-        "desc": "Ask about schedules",
-        "dialogue": [
-            {"ai": "Excuse me, Madam.", "user": "Yes, Please."},
-            {"ai": "Could you please tell me, what time is the next train to Ahmedabad?", "user": "The next departure is scheduled at 6:45 pm."},
-            {"ai": "Are you aware, what time it will reach Ahmedabad?", "user": "It reaches Ahmedabad around 4 am, early morning."},
-            {"ai": "Ok. Thank you for the information.", "user": "You are welcome."}
-        ]
-    },
-    "loan": {
-        "title": "Home Loan Info",
-        "icon": "home", 
-        "desc": "Bank assistance",
-        "dialogue": [
-            {"ai": "Excuse me. Would you please tell me, who could give me information about the home loan?", "user": "The lady at the 3rd counter is from the home loan department. She would assist you."},
-            {"ai": "Thank you!", "user": "You are welcome."},
-            {"ai": "Excuse me madam, I would like to get the information about the home loan.", "user": "Sure. You please fill in this form and I would give you all the related information."}
-        ]
-    },
-    "college": {
-        "title": "College Function",
-        "icon": "school",
-        "desc": "Chief guest details",
-        "dialogue": [
-            {"ai": "Hello, who is the chief guest for today's college function?", "user": "Mr. Joshi has been invited as the chief guest."},
-            {"ai": "When will he be coming here?", "user": "He has confirmed that he will reach the venue by 6 p.m."},
-            {"ai": "What is his occupation?", "user": "He is a famous social worker."},
-            {"ai": "Okay, is he the one who was recently in the news for movement against child labour?", "user": "Yes, you got it right."}
-        ]
-    }
+# TTS cache: synthesized audio is kept in memory (LRU) and on disk, keyed on voice/text/prosody
+TTS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "english-practice-ai", "tts")
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+TTS_MEMORY_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Latency tracing (off unless one of these is set): TRACE=1 keeps in-memory stats, TRACE_JSONL
+# appends every span to a file, TRACE_METRICS_PORT serves Prometheus text at /metrics and
+# TRACE_OVERLAY=1 shows live p50/p95 per stage in the app
+TRACE_JSONL = os.environ.get("TRACE_JSONL")
+TRACE_METRICS_PORT = int(os.environ.get("TRACE_METRICS_PORT", "0"))
+TRACE_OVERLAY = os.environ.get("TRACE_OVERLAY") == "1"
+TRACE_ENABLED = os.environ.get("TRACE") == "1" or bool(TRACE_JSONL or TRACE_METRICS_PORT or TRACE_OVERLAY)
+
+# Set by --serve: every session plays and records audio in its client instead of on this machine
+SERVER_MODE = False
+# Also set by --serve: browser recordings uploaded to the server (see web_server.py)
+answer_inbox = None
+
+# Fixed feedback lines, spoken after every scored answer
+PRAISE = "Good job!"
+RETRY_PROMPT = "Let's try that again."
+
+# UI changes requested through ViewLifecycle.request_update() are sent in one page.update() per frame
+UI_FRAME_INTERVAL = 1 / 30
+
+# Conversation state transitions: the last TURN_LOG_KEEP are kept per conversation, and all of
+# them are appended to the TURN_LOG JSONL file if set, for replaying a session
+TURN_LOG = os.environ.get("TURN_LOG")
+TURN_LOG_KEEP = 200
+# A turn whose handler fails (synthesis, transcription) pauses and says its line again; after
+# this many failures in a row without hearing the learner, the conversation gives up
+TURN_MAX_ERRORS = 3
+TURN_ERROR_PAUSE = 2.0
+
+# How many upcoming AI lines are synthesized in the background while the learner answers
+PREFETCH_LOOKAHEAD = 1
+
+# Streaming playback of uncached lines (edge-tts sends 24 kHz / 48 kbit/s mp3, ~6 KB per second)
+TTS_STREAMING = True
+STREAM_PREBUFFER_BYTES = 4000   # audio gathered before playback starts
+STREAM_SEGMENT_BYTES = 3000     # size of each later segment handed to the mixer
+STREAM_JITTER_SEGMENTS = 4      # decoded segments allowed to wait ahead of the player
+STREAM_STALL_TIMEOUT = 3.0      # seconds without data before falling back to full-file playback
+STREAM_PRELUDE_FRAMES = 8       # already-played mp3 frames decoded again in front of each segment
+# The mixer runs at edge-tts's output format, so decoded segments join sample-exactly
+MIXER_FREQUENCY = 24000
+MIXER_CHANNELS = 1
+
+# Scenario packs: every pack under scenarios/ next to this file, plus any directories listed in
+# SCENARIO_PATH (os.pathsep-separated). Only pack indexes are read at startup
+SCENARIO_DIRS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")]
+SCENARIO_DIRS += [d for d in os.environ.get("SCENARIO_PATH", "").split(os.pathsep) if d]
+SCENARIOS_PER_PAGE = 9
+# Libraries up to this size have every AI line pre-rendered at startup; larger ones rely on
+# bundled audio and per-conversation prefetching
+STARTUP_PRERENDER_MAX_SCENARIOS = 20
+
+tracer = Tracer(enabled=TRACE_ENABLED, jsonl_path=TRACE_JSONL)
+turn_log = None  # the TURN_LOG file, opened by the first transition
+
+def log_transition(event):
+    global turn_log
+    if turn_log is None:
+        turn_log = open(TURN_LOG, "a", buffering=1, encoding="utf-8")
+    turn_log.write(json.dumps(event) + "\n")
+
+def expected_answers(expected):
+    """Normalized accepted answers of a dialogue line, or of a plain expected string."""
+    return expected["answers"] if isinstance(expected, dict) else [normalize(expected)]
+
+def prerender_texts(scenarios=None):
+    """Every line the app can speak: all AI lines in the scenario library (or another
+    ScenarioLibrary) plus the feedback phrases. Reads every dialogue."""
+    texts = (get_services().library if scenarios is None else scenarios).texts() + [PRAISE, RETRY_PROMPT]
+    return list(dict.fromkeys(texts))
+
+# --- MP3 STREAM HELPERS ---
+# Layer III bitrates (kbit/s) by bitrate index, for MPEG-1 and for MPEG-2/2.5
+MP3_BITRATES = {
+    "mpeg1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "mpeg2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
 }
+# Sample rates by the header's version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def mp3_frame_length(data, offset=0):
+    """Length in bytes of the Layer III frame whose header starts at offset, or 0 if there is none."""
+    if len(data) < offset + 4 or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return 0
+    version = (data[offset + 1] >> 3) & 3
+    layer = (data[offset + 1] >> 1) & 3
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 3
+    padding = (data[offset + 2] >> 1) & 1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    bitrate = MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+def mp3_complete_frames(data):
+    """Returns how many leading bytes of data form whole mp3 frames, so the rest can wait for more data."""
+    offset = 0
+    while True:
+        length = mp3_frame_length(data, offset)
+        if not length or offset + length > len(data):
+            return offset
+        offset += length
+
+def mp3_frame_offsets(data):
+    """Start offsets of the whole mp3 frames at the beginning of data."""
+    offsets = []
+    offset = 0
+    while True:
+        length = mp3_frame_length(data, offset)
+        if not length or offset + length > len(data):
+            return offsets
+        offsets.append(offset)
+        offset += length
+
+class Mp3StreamDecoder:
+    """Decodes a frame-aligned mp3 stream segment by segment into PCM that joins without gaps.
+
+    Layer III frames borrow bits from earlier frames (the bit reservoir) and overlap-add with
+    the previous frame, so a segment decoded on its own starts with a click or a gap. Each
+    segment is decoded behind the last STREAM_PRELUDE_FRAMES frames of the stream instead, and
+    only the samples of its own frames are kept.
+    """
+    def __init__(self, prelude_frames=STREAM_PRELUDE_FRAMES):
+        self.prelude_frames = prelude_frames
+        self.reset()
+
+    def reset(self):
+        self.prelude = b""
+        self.source_samples = 0  # at the stream's own sample rate
+        self.emitted = 0  # at the mixer's sample rate
+
+    def decode(self, segment):
+        """Returns a pygame Sound holding just this segment's audio, or None if it has no frames."""
+        import pygame
+        offsets = mp3_frame_offsets(segment)
+        if not offsets:
+            return None
+        header = segment[offsets[0] + 1:offsets[0] + 3]
+        version = (header[0] >> 3) & 3
+        rate = MP3_SAMPLE_RATES[version][(header[1] >> 2) & 3]
+        frequency, size, channels = pygame.mixer.get_init()
+        sample_bytes = abs(size) // 8 * channels
+        pcm = pygame.mixer.Sound(file=io.BytesIO(self.prelude + segment)).get_raw()
+        # Running totals keep the kept length exact even when the mixer resamples
+        self.source_samples += len(offsets) * (1152 if version == 3 else 576)
+        wanted = round(self.source_samples * frequency / rate) - self.emitted
+        keep = min(wanted, len(pcm) // sample_bytes)
+        self.emitted += wanted
+        stream = self.prelude + segment[:offsets[-1] + mp3_frame_length(segment, offsets[-1])]
+        self.prelude = stream[mp3_frame_offsets(stream)[-self.prelude_frames:][0]:]
+        if keep <= 0:
+            return None
+        return pygame.mixer.Sound(buffer=pcm[len(pcm) - keep * sample_bytes:])
+
+# --- TTS CACHE ---
+class TTSCache:
+    """Two-tier store of synthesized mp3 audio: an in-memory LRU in front of a size-bounded disk directory.
+
+    Entries are content-addressed, so a change of voice, rate or pitch never serves stale audio.
+    Read-only bundle directories (pre-rendered audio shipped with scenario packs) are checked
+    after the disk tier and are never written to or evicted.
+    """
+    def __init__(self, directory=TTS_CACHE_DIR, max_disk_bytes=TTS_CACHE_MAX_BYTES,
+                 max_memory_bytes=TTS_MEMORY_CACHE_MAX_BYTES, bundles=()):
+        self.directory = directory
+        self.bundles = list(bundles)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self.disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def key(text, voice=VOICE, rate=TTS_RATE, pitch=TTS_PITCH):
+        raw = "\0".join([voice, rate, pitch, text])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".mp3")
+
+    def _bundled_path(self, key):
+        for bundle in self.bundles:
+            path = os.path.join(bundle, key + ".mp3")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def __contains__(self, key):
+        return key in self.memory or os.path.exists(self._path(key)) or self._bundled_path(key) is not None
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is not None:
+            self.memory.move_to_end(key)
+            return data
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return self._get_bundled(key)
+        # Touch the file so disk eviction sees it as recently used
+        try: os.utime(path)
+        except OSError: pass
+        self._remember(key, data)
+        return data
+
+    def _get_bundled(self, key):
+        path = self._bundled_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        self._remember(key, data)
+        path = self._path(key)
+        existing = os.path.getsize(path) if os.path.exists(path) else 0
+        # Write-then-rename so a crash never leaves a truncated mp3 behind
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+        self.disk_bytes += len(data) - existing
+        if self.disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _remember(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old)
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _disk_entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        """Drops least recently used files until the directory fits in max_disk_bytes."""
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.disk_bytes = total
+
+class SynthesisProgress:
+    """The audio of one running synthesis as it arrives, so a line can start playing while a
+    prefetch of it is still downloading."""
+    def __init__(self):
+        self.data = bytearray()
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+
+    def append(self, data):
+        self.data.extend(data)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Wakes the readers waiting on the current event; later waits get a fresh one
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def chunks(self):
+        """Yields everything received so far, then each new chunk until the synthesis ends.
+        Raises what the synthesis raised."""
+        offset = 0
+        while True:
+            if offset < len(self.data):
+                data = bytes(self.data[offset:])
+                offset += len(data)
+                yield data
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self.changed.wait()
+
+# --- SHARED SPEECH SERVICES ---
+class SpeechServices:
+    """Process-wide speech resources: the scenario library, one STT worker (so the model is
+    loaded once) and one TTS cache with its in-flight syntheses. Every session's EnglishAI
+    uses the same instance, from get_services().
+    """
+    def __init__(self, library):
+        self.library = library
+        self.stt = STTWorker(STT_MODEL_SIZE, engine=STT_ENGINE, profile=STT_PROFILE,
+                             torch_threads=STT_TORCH_THREADS,
+                             interop_threads=STT_INTEROP_THREADS, request_timeout=STT_REQUEST_TIMEOUT,
+                             timeout_base=STT_TIMEOUT_BASE, timeout_per_second=STT_TIMEOUT_PER_SECOND,
+                             health_interval=STT_HEALTH_INTERVAL,
+                             batch_window=STT_BATCH_WINDOW, max_batch=STT_MAX_BATCH,
+                             latency_slo=STT_LATENCY_SLO, cascade_model=STT_CASCADE_MODEL,
+                             cascade_min_logprob=STT_CASCADE_MIN_LOGPROB,
+                             cascade_min_score=STT_CASCADE_MIN_SCORE)
+        tracer.gauge("stt_queue_depth", lambda: len(self.stt.pending), "Transcriptions waiting or decoding.")
+        tracer.gauge("stt_max_queue_depth", lambda: self.stt.max_queue_depth, "Highest queue depth seen.")
+        tracer.gauge("stt_mean_batch_size", lambda: round(self.stt.mean_batch_size(), 3),
+                     "Average batch each transcription was decoded in.")
+        tracer.gauge("stt_cascade_escalation_rate", lambda: round(self.stt.escalation_rate(), 3),
+                     "Share of cascade attempts re-run on the main model.")
+        self.tts_cache = TTSCache(bundles=library.tts_dirs())
+        self.inflight = {}  # cache key -> synthesis task, so speak() and prefetches share one request
+        self.progress = {}  # cache key -> SynthesisProgress of a running prefetch
+        self.prerender_task = None
+        self.stt_ready_seconds = None  # process start -> model warmed up
+
+    def start_model(self):
+        """Starts loading the STT model in the worker process without waiting for it."""
+        if self.stt.process is None:
+            cascade = f", cascade from {STT_CASCADE_MODEL}" if STT_CASCADE_MODEL else ""
+            print(f"Loading {STT_ENGINE} ({STT_MODEL_SIZE}, {STT_PROFILE}{cascade})... (One time only)")
+            self.stt.start()
+
+    def load_model(self):
+        """Starts the STT worker and blocks until its model is loaded and warmed up."""
+        self.start_model()
+        if not self.stt.wait_ready():
+            raise RuntimeError(self.stt.error or "STT worker failed to start")
+
+    async def model_ready(self):
+        """Waits (off the event loop) for the model; True once ready, False if it failed to load."""
+        self.start_model()
+        if self.stt.ready.is_set():
+            return True
+        ready = await asyncio.get_running_loop().run_in_executor(None, self.stt.wait_ready)
+        if ready and self.stt_ready_seconds is None:
+            self.stt_ready_seconds = time.perf_counter() - STARTUP_STARTED
+            tracer.record("startup.stt_ready", self.stt_ready_seconds)
+            print(f"Startup: STT ready after {self.stt_ready_seconds:.2f}s")
+        return ready
+
+    async def synthesize(self, text):
+        """Returns the mp3 bytes for text, going to edge-tts only on a cache miss."""
+        key = TTSCache.key(text)
+        data = self.tts_cache.get(key)
+        if data is not None:
+            return data
+        while True:
+            task = self.prefetch(text)
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # A prefetch we joined was dropped, but this caller still needs the audio
+                if not task.cancelled(): raise
+                self._forget(key, task)
+
+    def prefetch(self, text):
+        """Starts synthesizing text in the background (if not already running) and returns the task."""
+        key = TTSCache.key(text)
+        task = self.inflight.get(key)
+        if task is None:
+            # Registered before the task first runs, so a speak() right after can already join it
+            progress = self.progress[key] = SynthesisProgress()
+            task = self.adopt(key, asyncio.ensure_future(self._fetch(text, key, progress)))
+            task.add_done_callback(lambda t: self._end_progress(key, progress, t))
+        return task
+
+    def adopt(self, key, task):
+        """Registers a task that will return the mp3 bytes for key (e.g. a playing stream), so
+        synthesize() and prefetch() join it instead of requesting the line again."""
+        self.inflight[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return task
+
+    def _forget(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+    def _end_progress(self, key, progress, task):
+        progress.finish(asyncio.CancelledError() if task.cancelled() else task.exception())
+        if self.progress.get(key) is progress:
+            del self.progress[key]
+
+    def stream(self, key):
+        """Chunks of the running prefetch of key, from its first byte on; None if none is running."""
+        progress = self.progress.get(key)
+        return progress.chunks() if progress is not None else None
+
+    async def tts_chunks(self, text):
+        """Yields the mp3 audio for text as it arrives, from edge-tts or from TTS_ENDPOINT if set."""
+        if TTS_ENDPOINT:
+            import aiohttp
+            params = {"text": text, "voice": VOICE, "rate": TTS_RATE, "pitch": TTS_PITCH}
+            async with aiohttp.ClientSession() as session:
+                async with session.get(TTS_ENDPOINT, params=params) as response:
+                    response.raise_for_status()
+                    async for data in response.content.iter_any():
+                        yield data
+            return
+        import edge_tts
+        communicate = edge_tts.Communicate(text, VOICE, rate=TTS_RATE, pitch=TTS_PITCH)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+    async def _fetch(self, text, key, progress):
+        with tracer.span("tts.synthesize"):
+            async for data in self.tts_chunks(text):
+                progress.append(data)
+        data = bytes(progress.data)
+        if data:
+            self.tts_cache.put(key, data)
+        return data
+
+    async def prerender(self, texts):
+        """Fills the TTS cache for texts; lines that fail (e.g. offline) are skipped."""
+        rendered = 0
+        for text in texts:
+            if TTSCache.key(text) in self.tts_cache:
+                continue
+            try:
+                await self.synthesize(text)
+                rendered += 1
+            except Exception as e:
+                print(f"Prerender Error ({text!r}): {e}")
+        return rendered
+
+    def warm_cache(self):
+        """Pre-renders the scripted lines in the background, once per process however many sessions
+        start. Large libraries only get the feedback phrases: reading and rendering every dialogue
+        would undo lazy loading, and their opening lines are prefetched when a card is opened."""
+        if self.prerender_task is None:
+            texts = (prerender_texts(self.library) if len(self.library) <= STARTUP_PRERENDER_MAX_SCENARIOS
+                     else [PRAISE, RETRY_PROMPT])
+            self.prerender_task = asyncio.ensure_future(self.prerender(texts))
+
+_services = None
+
+def get_services():
+    """The process's SpeechServices, built on first use: importing this module (the benchmark,
+    tests) must not scan scenario packs, create the TTS cache or start a worker client."""
+    global _services
+    if _services is None:
+        _services = SpeechServices(ScenarioLibrary(SCENARIO_DIRS))
+    return _services
 
 # --- AI BACKEND CLASS ---
 class EnglishAI:
-    def __init__(self):
-        self.model = None
-        self.recognizer = sr.Recognizer()
-        pygame.mixer.init()
+    """One learner's audio I/O: plays through this machine's speakers (pygame) and listens on
+    its microphone. Model, TTS cache and syntheses come from the shared SpeechServices.
+    """
+    hands_free = True  # answers end on their own (VAD endpointing); no tap needed
+
+    def __init__(self, services=None):
+        self.services = services if services is not None else get_services()
+        self.mic = ContinuousCapture(trailing_silence=LISTEN_TRAILING_SILENCE)
+        self.playback_epoch = 0  # bumped by stop_audio() so a streaming speak() knows to bail out
+        self.last_playback_stats = None
+        self.utterance = None  # answer being captured, so finish_answer() can end it
+
+    def init_audio(self):
+        # Deferred until first use: startup should not wait for SDL, and sessions that never
+        # play through this machine's speakers (browsers) must not grab the audio device.
+        import pygame
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(frequency=MIXER_FREQUENCY, channels=MIXER_CHANNELS)
 
     def load_model(self):
-        if not self.model:
-            print("Loading Whisper... (One time only)")
-            self.model = whisper.load_model(STT_MODEL_SIZE)
+        self.services.load_model()
 
     def stop_audio(self):
         """Forces audio to stop immediately."""
+        self.playback_epoch += 1
+        pygame = sys.modules.get("pygame")
+        if pygame is None or not pygame.mixer.get_init():
+            return  # nothing has played yet
+        pygame.mixer.stop()  # streamed segments play on mixer channels
         if pygame.mixer.music.get_busy():
             pygame.mixer.music.stop()
             pygame.mixer.music.unload()
 
+    def finish_answer(self):
+        """Ends the answer being captured now, as if the learner had stopped speaking."""
+        if self.utterance is not None:
+            self.utterance.stop.set()
+
     async def speak(self, text):
-        communicate = edge_tts.Communicate(text, VOICE)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-            temp_filename = fp.name
-        await communicate.save(temp_filename)
+        stats = await self._play(text)
+        self.last_playback_stats = stats
+        if stats["ttfa"] is not None:
+            tracer.record("tts.first_audio", stats["ttfa"])
+            print(f"TTS: {stats['mode']} ttfa={stats['ttfa'] * 1000:.0f}ms underruns={stats['underruns']} ({text[:40]!r})")
+
+    async def _play(self, text):
+        self.init_audio()
+        key = TTSCache.key(text)
+        # Cached lines are faster as a whole file. A prefetch of the line that is still running is
+        # joined as a stream, so the line starts as soon as its first segment is in
+        if TTS_STREAMING and key not in self.services.tts_cache:
+            prefetched = self.services.stream(key)
+            if prefetched is not None or key not in self.services.inflight:
+                with tracer.span("tts.stream"):
+                    return await self._speak_streaming(text, key, prefetched)
+        return await self._speak_file(text)
+
+    async def _speak_file(self, text):
+        import pygame
+        start = time.perf_counter()
+        stats = {"mode": "file", "ttfa": None, "underruns": 0}
+        data = await self.services.synthesize(text)
         try:
-            pygame.mixer.music.load(temp_filename)
+            # Cached audio plays straight from memory; no temp file round-trip
+            pygame.mixer.music.load(io.BytesIO(data), "mp3")
             pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                # Check if we need to abort (e.g. user left page)
-                await asyncio.sleep(0.1)
+            stats["ttfa"] = time.perf_counter() - start
+            with tracer.span("tts.playback"):
+                while pygame.mixer.music.get_busy():
+                    # Check if we need to abort (e.g. user left page)
+                    await asyncio.sleep(0.1)
             pygame.mixer.music.unload()
         except Exception as e:
             print(f"Audio Error: {e}")
+        return stats
+
+    async def _receive_stream(self, chunks, received, segments, key=None):
+        """Reads the TTS stream into frame-aligned segments on the (bounded) jitter buffer queue.
+
+        With a key, the stream is this line's own synthesis: the whole mp3 is cached and
+        returned, so callers joining it through services.inflight get the line too.
+        """
+        pending = bytearray()
+        threshold = STREAM_PREBUFFER_BYTES
+        async for data in chunks:
+            received.extend(data)
+            pending.extend(data)
+            cut = mp3_complete_frames(pending)
+            if cut >= threshold:
+                await segments.put(bytes(pending[:cut]))
+                del pending[:cut]
+                threshold = STREAM_SEGMENT_BYTES
+        if pending:
+            await segments.put(bytes(pending))
+        await segments.put(None)
+        data = bytes(received)
+        if data and key is not None:
+            self.services.tts_cache.put(key, data)
+        return data
+
+    async def _speak_streaming(self, text, key, prefetched=None):
+        """Plays audio as it arrives from edge-tts instead of waiting for the whole file.
+
+        Segments are decoded without gaps (Mp3StreamDecoder) and queued back-to-back on one mixer
+        channel. If the stream stalls, the rest of the line is fetched as a whole file and played
+        from where the stream left off. prefetched (services.stream()) plays along with a running
+        prefetch of the line instead of requesting it again.
+        """
+        import pygame
+        start = time.perf_counter()
+        epoch = self.playback_epoch
+        stats = {"mode": "stream", "ttfa": None, "underruns": 0}
+        received = bytearray()
+        segments = asyncio.Queue(maxsize=STREAM_JITTER_SEGMENTS)
+        if prefetched is not None:
+            stats["mode"] = "stream+prefetch"
+            # The prefetch owns the request and caches the line; this only reads along
+            receiver = asyncio.ensure_future(self._receive_stream(prefetched, received, segments))
+        else:
+            receiver = self.services.adopt(key, asyncio.ensure_future(
+                self._receive_stream(self.services.tts_chunks(text), received, segments, key)))
+        decoder = Mp3StreamDecoder()
+        channel = None
+        getter = None
+        played = 0
+        try:
+            while self.playback_epoch == epoch:
+                getter = asyncio.ensure_future(segments.get())
+                await asyncio.wait({getter, receiver}, timeout=STREAM_STALL_TIMEOUT,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                finished = receiver.done() and not receiver.cancelled()
+                if not getter.done() and finished and receiver.exception() is None:
+                    await getter  # the receiver finished cleanly, so its final items are queued
+                if getter.done():
+                    segment = getter.result()
+                else:
+                    # Stalled, failed or (by a joined prefetch being dropped) cancelled stream
+                    getter.cancel()
+                    if finished:
+                        print(f"TTS stream failed, retrying as a file: {receiver.exception()}")
+                    stats["mode"] = "stream+fallback"
+                    receiver.cancel()
+                    full = await self.services.synthesize(text)
+                    # edge-tts output is deterministic, so usually only the unplayed tail is needed
+                    if full[:played] == received[:played]:
+                        segment = full[played:]
+                    else:
+                        segment = full
+                        decoder.reset()
+                    receiver = None
+                if not segment:
+                    break
+                sound = decoder.decode(segment)
+                played += len(segment)
+                if sound is not None and channel is None:
+                    # Forced, so a channel still finishing other audio is taken over instead of
+                    # getting None back when all of them are busy
+                    channel = pygame.mixer.find_channel(True)
+                    if channel is None:
+                        raise RuntimeError("the mixer has no channels")
+                    channel.play(sound)
+                    stats["ttfa"] = time.perf_counter() - start
+                elif sound is not None:
+                    # Keep at most one segment queued behind the one that is playing
+                    while channel.get_queue() is not None and self.playback_epoch == epoch:
+                        await asyncio.sleep(0.02)
+                    if not channel.get_busy():
+                        stats["underruns"] += 1
+                        channel.play(sound)
+                    else:
+                        channel.queue(sound)
+                if receiver is None:
+                    break
+            while channel is not None and channel.get_busy() and self.playback_epoch == epoch:
+                await asyncio.sleep(0.1)
+        except Exception as e:
+            print(f"Audio Error: {e}")
         finally:
-            try: os.remove(temp_filename)
-            except: pass
+            for task in (getter, receiver):
+                if task is not None and not task.done():
+                    task.cancel()
+        return stats
+
+    def capture(self, utterance=None):
+        """Records one utterance from the always-open microphone; returns None if nothing was said."""
+        # Opened on first use and then kept open, so later turns skip device setup and calibration
+        self.mic.start()
+        return self.mic.capture_utterance(timeout=LISTEN_TIMEOUT, max_duration=LISTEN_MAX_DURATION,
+                                          utterance=utterance)
+
+    def _start_capture(self, utterance):
+        """Starts capturing one answer; returns a future resolving to its audio (or None)."""
+        return asyncio.get_running_loop().run_in_executor(None, self.capture, utterance)
+
+    async def listen(self, expected=None, on_partial=None):
+        """Captures and transcribes one answer.
 
-    def listen(self):
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
+        With an expected line, partial transcripts are produced while the learner is still
+        speaking (passed to on_partial) and the answer is accepted as soon as one of them
+        clearly matches, without waiting for the trailing silence or a final transcription.
+        """
+        answers = expected_answers(expected) if expected is not None else None
+        self.utterance = utterance = Utterance()
+        started = time.perf_counter()
+        capture = self._start_capture(utterance)
+        capture.add_done_callback(lambda _: tracer.record("capture", time.perf_counter() - started))
+        if expected is not None and STREAMING_RECOGNITION:
+            text = await self._early_accept(capture, utterance, expected, on_partial)
+            if text is not None:
+                return text
+        audio = await capture
+        if audio is None:
+            return ""
+        try:
+            # PCM goes straight to the worker over shared memory: no temp file, no ffmpeg subprocess
+            with tracer.span("stt.transcribe"):
+                result = await self.services.stt.transcribe(audio, answers=answers)
+            tracer.record("stt.queue_wait", result["queue_wait"])
+            return result["text"]
+        except Exception as e:
+            print(f"STT Error: {e}")
+            return ""
+
+    async def _early_accept(self, capture, utterance, expected, on_partial):
+        """Transcribes growing windows of the answer until capture ends or one clearly matches."""
+        covered = 0
+        while not capture.done():
+            await asyncio.wait({capture}, timeout=PARTIAL_INTERVAL)
+            audio = utterance.snapshot()
+            if capture.done() or audio is None or len(audio) - covered < PARTIAL_MIN_GROWTH * SAMPLE_RATE:
+                continue
+            covered = len(audio)
             try:
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=8)
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-                    fp.write(audio.get_wav_data())
-                    audio_filename = fp.name
-                
-                result = self.model.transcribe(audio_filename)
-                text = result["text"].strip()
-                os.remove(audio_filename)
+                with tracer.span("stt.partial"):
+                    # With a cascade, partials stay on the small model: one that is not clearly
+                    # right simply is not accepted early, and the final transcription escalates
+                    result = await self.services.stt.transcribe(audio, profile="short-phrase",
+                                                                answers=expected_answers(expected),
+                                                                escalate=False)
+                text = result["text"]
+            except Exception as e:
+                print(f"STT Error (partial): {e}")
+                return None
+            if on_partial is not None and text:
+                on_partial(text)
+            if self.check_similarity(text, expected) >= EARLY_ACCEPT_SCORE:
+                utterance.stop.set()
+                await capture
                 return text
-            except Exception:
-                return ""
+        return None
+
+    def check_similarity(self, user_text, expected):
+        """Score (0-100) of a transcript against a dialogue line's accepted answers, or a plain string."""
+        with tracer.span("scoring"):
+            score, _ = best_match(user_text, expected_answers(expected))
+        return score
+
+ai_engine = None  # the desktop learner's engine, built by the first desktop session
+
+async def fetch_recording(location, inbox=None):
+    """Bytes of a finished client recording, given the location the AudioRecorder reported.
+    blob: URLs can only be read from inbox, where the page uploads them."""
+    if location.startswith(("http://", "https://")):
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            async with session.get(location) as response:
+                response.raise_for_status()
+                return await response.read()
+    if location.startswith("blob:"):
+        # Browser recordings live in the tab's memory; the server cannot dereference them
+        if inbox is None:
+            raise RuntimeError("the browser kept the recording as a blob: URL the server cannot read")
+        return await inbox.take(location)
+    path = location[len("file://"):] if location.startswith("file://") else location
+    with open(path, "rb") as f:
+        return f.read()
+
+class WebEnglishAI(EnglishAI):
+    """One learner connected to the server: audio is played and recorded by their client.
+
+    Lines are played by the client (ft.Audio) and answers are recorded there (ft.AudioRecorder)
+    until the learner taps the mic, then transcribed by the shared worker. Served by web_server
+    (inbox set), lines are fetched from its /tts/ route and answers are claimed from the
+    browser's uploads; otherwise lines are sent inline as base64 and only recordings the
+    server can read (files, http URLs) are usable.
+    """
+    hands_free = False  # no server-side VAD on client recordings; the learner taps to finish
+
+    def __init__(self, page, services=None, inbox=None):
+        super().__init__(services)
+        self.page = page
+        self.inbox = inbox
+        self.mic = None
+        self.player = None
+        self.recorder = ft.AudioRecorder(audio_encoder=ft.AudioEncoder.WAV, sample_rate=SAMPLE_RATE,
+                                         channels_num=1)
+        page.overlay.append(self.recorder)
+        page.update()
+
+    def init_audio(self):
+        pass
 
-    def check_similarity(self, user_text, expected_text):
-        if not user_text: return 0
-        return fuzz.ratio(user_text.lower(), expected_text.lower())
+    def stop_audio(self):
+        self.playback_epoch += 1
+        self.finish_answer()
+        if self.player is not None:
+            try: self.player.pause()
+            except Exception: pass  # the session may already be gone
+
+    async def _play(self, text):
+        start = time.perf_counter()
+        epoch = self.playback_epoch
+        stats = {"mode": "client", "ttfa": None, "underruns": 0}
+        try:
+            data = await self.services.synthesize(text)
+        except Exception as e:
+            # Raised on to the turn, which tells the learner and says the line again
+            raise RuntimeError(f"could not synthesize {text[:40]!r}: {e}") from e
+        finished = asyncio.Event()
+
+        async def on_state(e):
+            if e.state == ft.AudioState.PLAYING and stats["ttfa"] is None:
+                stats["ttfa"] = time.perf_counter() - start
+            elif e.state in (ft.AudioState.COMPLETED, ft.AudioState.STOPPED, ft.AudioState.DISPOSED):
+                finished.set()
+
+        key = TTSCache.key(text)
+        if self.inbox is not None and key in self.services.tts_cache:
+            # By URL: the browser streams and caches the file instead of the mp3 riding the
+            # session's websocket as base64
+            source = {"src": web_server.tts_url(self.page.url, key)}
+        else:
+            source = {"src_base64": base64.b64encode(data).decode("ascii")}
+        self.player = ft.Audio(autoplay=True, on_state_changed=on_state, **source)
+        # edge-tts mp3 is ~6 KB per second; never wait much past that if the client goes quiet
+        deadline = time.perf_counter() + len(data) / 6000 + 5.0
+        try:
+            self.page.overlay.append(self.player)
+            self.page.update()
+            with tracer.span("tts.playback"):
+                while not finished.is_set() and self.playback_epoch == epoch and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.1)
+        except Exception as e:
+            print(f"Audio Error: {e}")
+        finally:
+            if self.player in self.page.overlay:
+                self.page.overlay.remove(self.player)
+                try: self.page.update()
+                except Exception: pass
+            self.player = None
+        return stats
+
+    def _start_capture(self, utterance):
+        return asyncio.ensure_future(self._record(utterance))
+
+    async def _record(self, utterance):
+        """Records in the client until finish_answer() or the time limit, then fetches the WAV."""
+        await self.recorder.start_recording_async()
+        deadline = time.perf_counter() + LISTEN_TIMEOUT + LISTEN_MAX_DURATION
+        try:
+            while not utterance.stop.is_set() and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            # Also on cancellation (the learner left the view), so the client mic is released
+            location = await self.recorder.stop_recording_async()
+        if not location:
+            return None
+        try:
+            audio = decode_wav(await fetch_recording(location, self.inbox))
+        except Exception as e:
+            print(f"Recording Error: {e}")
+            return None
+        return audio if len(audio) else None
+
+class Prefetcher:
+    """Synthesizes upcoming lines of a conversation ahead of time, with bounded lookahead.
+
+    Owned by one conversation view; cancel() drops whatever is still pending when the user leaves.
+    """
+    def __init__(self, services, lookahead=PREFETCH_LOOKAHEAD):
+        self.services = services
+        self.lookahead = lookahead
+        self.tasks = set()
+
+    def schedule(self, dialogue, step):
+        """Queues the feedback phrases and the AI lines after `step` that are not cached yet."""
+        upcoming = [line["ai"] for line in dialogue[step + 1:step + 1 + self.lookahead]]
+        for text in [PRAISE, RETRY_PROMPT] + upcoming:
+            if TTSCache.key(text) in self.services.tts_cache:
+                continue
+            task = self.services.prefetch(text)
+            if task not in self.tasks:
+                self.tasks.add(task)
+                task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self.tasks.discard(task)
+        # Retrieve the exception so a failed prefetch (e.g. offline) is not reported as unhandled;
+        # speak() simply retries the synthesis when the line is actually needed.
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Prefetch Error: {task.exception()}")
+
+    def cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+        self.tasks.clear()
+
+class CancelToken:
+    """Cancels one conversation. Callbacks registered with on_cancel() run once, at cancel(),
+    unless they are removed first."""
+    def __init__(self):
+        self.cancelled = False
+        self.callbacks = []
+
+    def on_cancel(self, callback):
+        if self.cancelled:
+            callback()
+        else:
+            self.callbacks.append(callback)
 
-ai_engine = EnglishAI()
+    def remove(self, callback):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        for callback in self.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancel Error: {e}")
+        self.callbacks.clear()
+
+class TurnMachine:
+    """Runs one conversation as an explicit state machine in a single loop.
+
+    States: speaking -> listening -> scoring -> scored -> correct / retry (or no_speech) ->
+    speaking ... -> complete. Each handler returns the next state, so retries never nest and
+    memory stays flat. A handler that raises leads to error, which says the line again, or to
+    failed after TURN_MAX_ERRORS in a row. cancel() stops speech, ends the capture and cancels
+    the running task at once. Every transition is kept in a bounded log (and appended to
+    TURN_LOG if set) for replay.
+    """
+    def __init__(self, engine, dialogue, prefetcher, render, session=None, scenario=None):
+        self.engine = engine
+        self.dialogue = dialogue
+        self.prefetcher = prefetcher
+        self.render = render  # render(state, **detail) updates the view
+        self.session = session
+        self.scenario = scenario
+        self.token = CancelToken()
+        self.state = None
+        self.step = 0
+        self.line = None
+        self.user_text = ""
+        self.turn_started = None
+        self.errors = 0  # failed handlers since the learner was last heard
+        self.transitions = deque(maxlen=TURN_LOG_KEEP)
+        self.handlers = {
+            "speaking": self._speaking, "listening": self._listening, "no_speech": self._no_speech,
+            "scoring": self._scoring, "correct": self._correct, "retry": self._retry,
+            "error": self._error, "failed": self._failed, "complete": self._complete,
+        }
+
+    def cancel(self):
+        self.token.cancel()
+
+    async def run(self):
+        """Plays the conversation to the end; returns False if it was cancelled first."""
+        callbacks = (self.engine.stop_audio, self.engine.finish_answer, asyncio.current_task().cancel)
+        for callback in callbacks:
+            self.token.on_cancel(callback)
+        state = "speaking" if self.dialogue else "complete"
+        detail = {}
+        try:
+            while state is not None and not self.token.cancelled:
+                self._transition(state, **detail)
+                detail = {}
+                try:
+                    state = await self.handlers[state]()
+                except Exception as e:
+                    # Left alone, the exception would end the task and freeze the view mid-turn
+                    print(f"Turn Error ({self.state}): {e}")
+                    state, detail = "error", {"error": f"{type(e).__name__}: {e}"}
+        except asyncio.CancelledError:
+            self._transition("cancelled")
+            if not self.token.cancelled:
+                raise  # cancelled from outside (e.g. shutdown), not by this conversation
+            return False
+        finally:
+            # Once run() returns, cancel() must not reach the caller: it may be switching views,
+            # which cancels this machine and would otherwise cancel the caller's task with it
+            for callback in callbacks:
+                self.token.remove(callback)
+        return not self.token.cancelled
+
+    def _transition(self, state, **detail):
+        event = {"ts": time.time(), "from": self.state, "to": state, "step": self.step, **detail}
+        self.transitions.append(event)
+        if TURN_LOG:
+            log_transition({"session": self.session, "scenario": self.scenario, **event})
+        self.state = state
+        if state == "speaking":
+            self.line = self.dialogue[self.step]
+        self.render(state, **detail)
+
+    async def _speaking(self):
+        self.turn_started = time.perf_counter()
+        await self.engine.speak(self.line["ai"])
+        return "listening"
+
+    async def _listening(self):
+        # While the learner answers, synthesize the next line and the feedback in the background
+        self.prefetcher.schedule(self.dialogue, self.step)
+        self.user_text = await self.engine.listen(
+            self.line, on_partial=lambda text: self.render("listening", partial=text))
+        return "scoring" if self.user_text else "no_speech"
+
+    async def _no_speech(self):
+        await asyncio.sleep(1)
+        return "speaking"
+
+    async def _scoring(self):
+        self.errors = 0
+        score = self.engine.check_similarity(self.user_text, self.line)
+        tracer.record("turn", time.perf_counter() - self.turn_started)
+        self._transition("scored", text=self.user_text, score=score)
+        return "correct" if score >= 80 else "retry"
+
+    async def _correct(self):
+        await self.engine.speak(PRAISE)
+        self.step += 1
+        await asyncio.sleep(1)
+        return "speaking" if self.step < len(self.dialogue) else "complete"
+
+    async def _retry(self):
+        await self.engine.speak(RETRY_PROMPT)
+        return "speaking"
+
+    async def _error(self):
+        self.errors += 1
+        await asyncio.sleep(TURN_ERROR_PAUSE)
+        return "speaking" if self.errors < TURN_MAX_ERRORS else "failed"
+
+    async def _failed(self):
+        self.prefetcher.cancel()
+        await asyncio.sleep(3)
+        return None
+
+    async def _complete(self):
+        self.prefetcher.cancel()
+        await asyncio.sleep(3)
+        return None
 
 # --- VISUAL EFFECTS: GLITTER/STARS ---
 class StarField(ft.Stack):
@@ -142,26 +1134,189 @@ class StarField(ft.Stack):
         while True:
             for star in self.stars:
                 star.opacity = random.random()
-                star.update()
+            # One diff for the whole field instead of a round-trip per star
+            self.update()
             await asyncio.sleep(2)
 
+class ViewLifecycle:
+    """Owns what runs behind the view on screen, for one session.
+
+    Background loops are started with spawn() and cleanups registered with on_exit(); enter()
+    cancels and runs them before cleaning the page for the next view, so nothing outlives
+    its view. request_update() coalesces control changes into one page.update() per frame.
+    """
+    def __init__(self, page):
+        self.page = page
+        self.tasks = set()
+        self.session_tasks = set()  # live across views until close()
+        self.exit_callbacks = []
+        self.flush_handle = None
+
+    def spawn(self, coro, session=False):
+        task = asyncio.ensure_future(coro)
+        tasks = self.session_tasks if session else self.tasks
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def on_exit(self, callback):
+        self.exit_callbacks.append(callback)
+
+    def _cancel(self, tasks):
+        # The task switching views may itself belong to the old view; it finishes on its own
+        current = asyncio.current_task()
+        for task in list(tasks):
+            if task is not current:
+                task.cancel()
+        tasks.clear()
+
+    def leave(self):
+        """Cancels the current view's tasks and runs its exit callbacks."""
+        self._cancel(self.tasks)
+        callbacks, self.exit_callbacks = self.exit_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"View Exit Error: {e}")
+
+    def enter(self):
+        """Tears down the current view and clears the page for the next one."""
+        self.leave()
+        self.page.clean()
+
+    def close(self):
+        """Session ended: stops everything, including session-wide loops."""
+        self.leave()
+        self._cancel(self.session_tasks)
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def request_update(self):
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(UI_FRAME_INTERVAL, self.flush)
+
+    def flush(self):
+        """Sends pending control changes now."""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        try:
+            self.page.update()
+        except Exception as e:
+            print(f"UI Update Error: {e}")
+
+class LatencyOverlay(ft.Container):
+    """Debug overlay with live p50/p95 per traced stage (TRACE_OVERLAY=1)."""
+    def __init__(self):
+        self.rows = ft.Column(spacing=2)
+        super().__init__(content=self.rows, right=10, bottom=10, padding=10, opacity=0.85,
+                         bgcolor=ft.Colors.BLACK, border_radius=8, border=ft.border.all(1, ft.Colors.GREY_800))
+
+    def refresh(self):
+        def row(text, color="grey"):
+            return ft.Text(text, size=11, color=color, font_family="monospace")
+        rows = [row(f"{'stage':16}{'p50 ms':>8}{'p95 ms':>8}{'n':>6}", ft.Colors.CYAN_200)]
+        for name, stat in tracer.stats().items():
+            rows.append(row(f"{name:16}{stat['p50'] * 1000:8.0f}{stat['p95'] * 1000:8.0f}{stat['count']:6d}"))
+        self.rows.controls = rows
+        self.update()
+
+    async def run(self):
+        while True:
+            self.refresh()
+            await asyncio.sleep(1)
+
+class ModelStatus(ft.Column):
+    """Progress of the speech model loading in the background; hidden once it is ready."""
+    # Rough share of the load done at each stage the worker reports
+    STAGES = {"stopped": 0.0, "starting": 0.05, "importing": 0.15, "loading model": 0.4,
+              "loading cascade model": 0.6, "warming up": 0.8, "ready": 1.0}
+
+    def __init__(self, stt):
+        self.stt = stt
+        self.bar = ft.ProgressBar(width=300, value=0, color=ft.Colors.CYAN_400, bgcolor=ft.Colors.GREY_800)
+        self.label = ft.Text("", size=12, color="grey")
+        super().__init__([self.bar, self.label], horizontal_alignment="center", spacing=5)
+        self.refresh()
+
+    def refresh(self):
+        status = self.stt.status
+        self.bar.value = self.STAGES.get(status, 0.0)
+        if status == "failed":
+            self.label.value = f"Speech model failed to load: {self.stt.error}"
+            self.label.color = ft.Colors.RED_300
+        else:
+            self.label.value = f"Preparing speech recognition ({status})..."
+        self.visible = status != "ready"
+
+metrics_server = None
+first_paint_seconds = None  # process start -> first view drawn, for the first session only
+
 # --- UI APPLICATION ---
 async def main(page: ft.Page):
+    global ai_engine, metrics_server, first_paint_seconds
     page.title = "English Practice AI"
     page.theme_mode = ft.ThemeMode.DARK
     page.fonts = {"Inter": "https://fonts.gstatic.com/s/inter/v12/UcC73FwrK3iLTeHuS_fvQtMwCp50KnMa1ZL7.ttf"}
     page.theme = ft.Theme(font_family="Inter")
     
-    ai_engine.load_model()
+    # Browser sessions (and every session in server mode) get their own client-side audio;
+    # the desktop app uses this machine's speakers and mic. All share one model and TTS cache.
+    session_started = time.perf_counter()
+    services = get_services()
+    library = services.library
+    if page.web or SERVER_MODE:
+        engine = WebEnglishAI(page, services, answer_inbox)
+    else:
+        if ai_engine is None:
+            ai_engine = EnglishAI(services)
+        engine = ai_engine
+    views = ViewLifecycle(page)
+    # The model loads in the worker while the UI is already up; scenarios open once it is ready
+    views.spawn(services.model_ready(), session=True)
+    # Warm the TTS cache for every scripted line in the background
+    services.warm_cache()
+
+    def model_gate(on_ready):
+        """A progress indicator for the model load; on_ready() runs (in this view) once it is up."""
+        status = ModelStatus(services.stt)
 
-    # State to handle stopping audio when leaving pages
-    state = {"is_active": True}
+        async def watch():
+            while not services.stt.ready.is_set() and services.stt.status != "failed":
+                status.refresh()
+                views.request_update()
+                await asyncio.sleep(0.25)
+            status.refresh()
+            if services.stt.ready.is_set():
+                on_ready()
+            views.request_update()
+        if services.stt.ready.is_set():
+            on_ready()
+        else:
+            views.spawn(watch())
+        return status
+
+    if TRACE_METRICS_PORT and metrics_server is None:
+        metrics_server = await tracer.serve_metrics(TRACE_METRICS_PORT)
+    if TRACE_OVERLAY:
+        # page.overlay survives page.clean(), so the stats stay up across views
+        overlay = LatencyOverlay()
+        page.overlay.append(overlay)
+        page.update()
+        views.spawn(overlay.run(), session=True)
+
+    async def on_close(e):
+        # The learner closed the tab: stop their turn loop, every view task and the recorder
+        views.close()
+        engine.stop_audio()
+    page.on_close = on_close
 
     # --- VIEW 1: THE DEV JOURNEY PAGE ---
     async def show_journey(e=None):
-        page.clean()
-        state["is_active"] = False
-        ai_engine.stop_audio()
+        views.enter()
+        engine.stop_audio()
         
         # SCROLL FIX: Enable scrolling on the PAGE level
         page.scroll = ft.ScrollMode.AUTO
@@ -226,11 +1381,23 @@ async def main(page: ft.Page):
 
     # --- VIEW 2: CONVERSATION ---
     async def start_conversation(scenario_key):
-        page.clean()
-        state["is_active"] = True
-        data = SCENARIOS[scenario_key]
-        dialogue_list = data["dialogue"]
-        current_step = 0
+        data = library.info(scenario_key)
+        try:
+            # Read from the pack on first use, so only opened scenarios are ever in memory
+            dialogue_list = library.dialogue(scenario_key)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Scenario Error ({scenario_key}): {e}")
+            # Stay on the grid, but say why the card did nothing
+            page.open(ft.SnackBar(ft.Text(f"Could not open \"{data['title']}\": {e}"),
+                                  bgcolor=ft.Colors.RED_900))
+            return
+        views.enter()
+        tracer.bind(session=page.session_id, scenario=scenario_key)
+        grid_page = library.page_of(scenario_key, SCENARIOS_PER_PAGE)
+        prefetcher = Prefetcher(services)
+        # Start on the opening line right away, before the view has even settled
+        prefetcher.schedule(dialogue_list, -1)
+        views.on_exit(prefetcher.cancel)
 
         chat_list = ft.ListView(expand=True, spacing=15, padding=20, auto_scroll=True)
         status_text = ft.Text("Initializing...", italic=True, color="grey")
@@ -252,71 +1419,54 @@ async def main(page: ft.Page):
                 shadow=ft.BoxShadow(blur_radius=5, color=ft.Colors.BLACK26)
             )
             chat_list.controls.append(bubble)
-            page.update()
+            views.request_update()
 
-        async def play_turn():
-            nonlocal current_step
-            if not state["is_active"]: return
-
-            if current_step >= len(dialogue_list):
+        def render(state, text=None, score=None, partial=None, error=None):
+            line = machine.line
+            if state == "speaking":
+                status_text.value = "AI is speaking..."
+                status_text.color = "grey"
+                mic_icon.color = "grey"
+                add_chat_bubble(line["ai"], True)
+            elif state == "listening":
+                hint_text.value = f"Hint: Say '{line['user']}'"
+                if partial:
+                    hint_text.value += f"\nHeard: {partial}..."
+                else:
+                    status_text.value = "Listening... Speak now!" if engine.hands_free else "Listening... Tap the mic when you're done."
+                    mic_icon.color = "red"
+                    mic_icon.scale = 1.2
+            elif state in ("no_speech", "scoring"):
+                mic_icon.color = "grey"
+                mic_icon.scale = 1.0
+                if state == "no_speech":
+                    status_text.value = "Didn't hear anything. Trying again..."
+            elif state == "scored":
+                add_chat_bubble(text, False)
+                if score >= 80:
+                    status_text.value = f"Correct! (Match: {score}%)"
+                    status_text.color = "green"
+                else:
+                    status_text.value = f"Not quite. (Match: {score}%) Try again."
+                    status_text.color = "red"
+            elif state == "error":
+                mic_icon.color = "grey"
+                mic_icon.scale = 1.0
+                status_text.value = f"Something went wrong ({error}). Trying again..."
+                status_text.color = "red"
+            elif state == "failed":
+                add_chat_bubble("Something keeps going wrong. Returning to menu...", True)
+            elif state == "complete":
                 add_chat_bubble("Conversation Complete! returning to menu...", True)
-                await asyncio.sleep(3)
-                if state["is_active"]: await show_scenarios()
-                return
-
-            line = dialogue_list[current_step]
-            
-            status_text.value = "AI is speaking..."
-            mic_icon.color = "grey"
-            page.update()
-            
-            add_chat_bubble(line["ai"], True)
-            await ai_engine.speak(line["ai"])
-            
-            if not state["is_active"]: return 
-
-            hint_text.value = f"Hint: Say '{line['user']}'"
-            status_text.value = "Listening... Speak now!"
-            mic_icon.color = "red"
-            mic_icon.scale = 1.2
-            page.update()
-            
-            loop = asyncio.get_running_loop()
-            user_text = await loop.run_in_executor(None, ai_engine.listen)
-            
-            mic_icon.color = "grey"
-            mic_icon.scale = 1.0
-            
-            if not state["is_active"]: return 
+            views.request_update()
 
-            if not user_text:
-                status_text.value = "Didn't hear anything. Trying again..."
-                page.update()
-                await asyncio.sleep(1)
-                await play_turn()
-                return
-
-            add_chat_bubble(user_text, False)
-            score = ai_engine.check_similarity(user_text, line["user"])
-            if score >= 80:
-                status_text.value = f"Correct! (Match: {score}%)"
-                status_text.color = "green"
-                page.update()
-                await ai_engine.speak("Good job!")
-                current_step += 1
-                await asyncio.sleep(1)
-                await play_turn()
-            else:
-                status_text.value = f"Not quite. (Match: {score}%) Try again."
-                status_text.color = "red"
-                page.update()
-                await ai_engine.speak("Let's try that again.")
-                await play_turn()
+        machine = TurnMachine(engine, dialogue_list, prefetcher, render,
+                              session=page.session_id, scenario=scenario_key)
+        # Leaving the view (back button, another view, closed tab) stops speech and capture at once
+        views.on_exit(machine.cancel)
 
         async def go_back(e):
-            state["is_active"] = False 
-            ai_engine.stop_audio() 
-            await show_scenarios()
+            await show_scenarios(page_number=grid_page)
 
         page.add(ft.Column([
             ft.Container(
@@ -326,24 +1476,29 @@ async def main(page: ft.Page):
             chat_list,
             ft.Divider(height=1, color="transparent"),
             ft.Container(
-                content=ft.Column([hint_text, ft.Row([mic_icon, status_text], alignment="center")], horizontal_alignment="center"),
+                content=ft.Column([hint_text, ft.Row([ft.Container(content=mic_icon, on_click=lambda e: engine.finish_answer()), status_text], alignment="center")], horizontal_alignment="center"),
                 padding=20, bgcolor=ft.Colors.GREY_900, border_radius=ft.border_radius.only(top_left=20, top_right=20)
             )
         ], expand=True))
-        await asyncio.sleep(1)
-        await play_turn()
+
+        async def begin():
+            await asyncio.sleep(1)
+            if await machine.run():
+                await show_scenarios(page_number=grid_page)
+        # Owned by the view, so leaving it cancels the turn wherever it is
+        views.spawn(begin())
 
     # --- VIEW 3: SCENARIO SELECTION ---
-    async def show_scenarios(e=None):
-        page.clean()
-        state["is_active"] = False
-        ai_engine.stop_audio()
+    async def show_scenarios(e=None, page_number=0):
+        views.enter()
+        engine.stop_audio()
 
         page.vertical_alignment = ft.MainAxisAlignment.START
         page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
 
         def create_card(key, info):
-            async def on_card_click(e): await start_conversation(key)
+            async def on_card_click(e):
+                if services.stt.ready.is_set(): await start_conversation(key)
             return ft.Container(
                 content=ft.Column([
                     ft.Icon(name=info["icon"], size=45, color=ft.Colors.CYAN_200),
@@ -355,7 +1510,9 @@ async def main(page: ft.Page):
                 border=ft.border.all(1, ft.Colors.CYAN_400), border_radius=20, padding=20,
                 on_click=on_card_click, shadow=ft.BoxShadow(blur_radius=15, spread_radius=1, color=ft.Colors.CYAN_900),
                 animate_scale=ft.Animation(100, "easeOut"),
-                on_hover=lambda e: card_hover(e.control, e.data)
+                on_hover=lambda e: card_hover(e.control, e.data),
+                # Greyed out until the speech model is ready
+                disabled=not ready, opacity=1.0 if ready else 0.4
             )
 
         def card_hover(card, is_hovering):
@@ -376,6 +1533,38 @@ async def main(page: ft.Page):
         
         async def go_home(e): await show_landing()
 
+        # Only the visible page of the library gets cards; paging swaps them in place
+        page_count = library.page_count(SCENARIOS_PER_PAGE)
+        page_number = min(page_number, page_count - 1)
+        cards = ft.Row(alignment="center", wrap=True, spacing=30)
+        page_label = ft.Text(color="grey")
+        prev_button = ft.IconButton("chevron_left", tooltip="Previous page", on_click=lambda e: turn_page(-1))
+        next_button = ft.IconButton("chevron_right", tooltip="Next page", on_click=lambda e: turn_page(1))
+        pager = ft.Row([prev_button, page_label, next_button], alignment="center", visible=page_count > 1)
+
+        def show_page():
+            cards.controls = [create_card(info["key"], info)
+                              for info in library.page(page_number, SCENARIOS_PER_PAGE)]
+            page_label.value = f"Page {page_number + 1} of {page_count}"
+            prev_button.disabled = page_number == 0
+            next_button.disabled = page_number == page_count - 1
+
+        def turn_page(step):
+            nonlocal page_number
+            page_number = max(0, min(page_count - 1, page_number + step))
+            show_page()
+            views.request_update()
+
+        def enable_cards():
+            nonlocal ready
+            ready = True
+            for card in cards.controls:
+                card.disabled = False
+                card.opacity = 1.0
+        ready = services.stt.ready.is_set()
+        show_page()
+        model_status = model_gate(enable_cards)
+
         # Navigation Bar
         nav_bar = ft.Container(
             content=ft.Row([
@@ -392,14 +1581,16 @@ async def main(page: ft.Page):
             ft.Container(height=20),
             instructions,
             ft.Container(height=40),
-            ft.Row([create_card(k, v) for k, v in SCENARIOS.items()], alignment="center", wrap=True, spacing=30)
+            model_status,
+            cards,
+            ft.Container(height=10),
+            pager
         ], horizontal_alignment="center", alignment="center"))
 
     # --- VIEW 4: LANDING PAGE ---
     async def show_landing(e=None):
-        page.clean()
-        state["is_active"] = False
-        ai_engine.stop_audio()
+        views.enter()
+        engine.stop_audio()
 
         page.vertical_alignment = ft.MainAxisAlignment.CENTER
         
@@ -419,16 +1610,17 @@ async def main(page: ft.Page):
             while True:
                 try:
                     await asyncio.sleep(2)
-                    animated_text.opacity = 0; animated_text.offset = ft.Offset(0, -0.5); animated_text.update()
+                    animated_text.opacity = 0; animated_text.offset = ft.Offset(0, -0.5); views.request_update()
                     await asyncio.sleep(0.3)
                     idx = (idx + 1) % len(titles)
                     animated_text.value = titles[idx]
+                    # The jump below must reach the client on its own, before the slide back in
                     animated_text.offset = ft.Offset(0, 0.5); animated_text.update()
-                    animated_text.opacity = 1; animated_text.offset = ft.Offset(0, 0); animated_text.update()
+                    animated_text.opacity = 1; animated_text.offset = ft.Offset(0, 0); views.request_update()
                 except: break
         
-        asyncio.create_task(animate_text_loop())
-        asyncio.create_task(stars.animate())
+        views.spawn(animate_text_loop())
+        views.spawn(stars.animate())
 
         badge = ft.Container(
             content=ft.Row([ft.Text("Read how I was made", size=12), ft.Icon("info", size=14)], alignment="center"),
@@ -456,7 +1648,9 @@ async def main(page: ft.Page):
             ft.Container(height=20),
             features,
             ft.Container(height=40),
-            ft.ElevatedButton("Start Learning", icon="arrow_forward", height=50, color="black", bgcolor="white", on_click=on_start_click)
+            ft.ElevatedButton("Start Learning", icon="arrow_forward", height=50, color="black", bgcolor="white", on_click=on_start_click),
+            ft.Container(height=20),
+            model_gate(lambda: None)
         ], horizontal_alignment="center", alignment="center")
 
         page.add(ft.Stack([
@@ -465,6 +1659,45 @@ async def main(page: ft.Page):
         ], expand=True))
 
     await show_landing()
+    if first_paint_seconds is None:
+        first_paint_seconds = time.perf_counter() - STARTUP_STARTED
+        tracer.record("startup.first_paint", first_paint_seconds)
+        print(f"Startup: first paint after {first_paint_seconds:.2f}s")
+    tracer.record("session.first_paint", time.perf_counter() - session_started)
 
 if __name__ == "__main__":
-    ft.app(target=main)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="English Practice AI")
+    parser.add_argument("--prerender", action="store_true",
+                        help="Synthesize every scenario line into the TTS cache and exit")
+    parser.add_argument("--bundle-tts", metavar="PACK",
+                        help="Synthesize a scenario pack's lines into its tts/ directory and exit")
+    parser.add_argument("--serve", action="store_true",
+                        help="Serve the app to many browsers; audio is played and recorded in each client")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to serve on with --serve")
+    parser.add_argument("--port", type=int, default=8550, help="Port to serve on with --serve")
+    args = parser.parse_args()
+    services = get_services()
+    if args.prerender:
+        count = asyncio.run(services.prerender(prerender_texts()))
+        print(f"Pre-rendered {count} new line(s) into {TTS_CACHE_DIR}")
+        sys.exit(0)
+    if args.bundle_tts:
+        # A cache rooted in the pack, with no size limit, is exactly the bundle layout
+        bundle_dir = os.path.join(args.bundle_tts, "tts")
+        services.tts_cache = TTSCache(bundle_dir, max_disk_bytes=float("inf"))
+        count = asyncio.run(services.prerender(prerender_texts(ScenarioLibrary([args.bundle_tts]))))
+        print(f"Pre-rendered {count} new line(s) into {bundle_dir}")
+        sys.exit(0)
+    if args.serve:
+        SERVER_MODE = True
+        if "STT_BATCH_WINDOW" not in os.environ:
+            services.stt.batch_window = STT_SERVER_BATCH_WINDOW
+    # Start loading the model now, so it overlaps with the window (or server) coming up
+    services.start_model()
+    if args.serve:
+        answer_inbox = web_server.RecordingInbox()
+        server_app = web_server.create_app(main, answer_inbox, lambda key: services.tts_cache.get(key))
+        print(f"Serving on http://{args.host}:{args.port}")
+        web_server.serve(server_app, args.host, args.port)
+    else:
+        ft.app(target=main)
\ No newline at end of file
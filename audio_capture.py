@@ -0,0 +1,204 @@
+"""Always-open microphone capture with frame-level voice activity detection.
+
+The input stream is opened once and feeds a ring buffer of 30 ms frames from PortAudio's
+callback thread. A noise-floor estimate adapts continuously in the background, so a turn
+costs only the speech itself: no per-turn device open and no ambient-noise calibration.
+"""
+import collections
+import io
+import threading
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+class Utterance:
+    """One answer while it is being captured, shared between the capture thread and readers.
+
+    snapshot() returns the audio so far (for partial transcription); setting `stop` makes
+    the capture end at the next frame, e.g. once a partial result is already good enough.
+    """
+    def __init__(self):
+        self.frames = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def extend(self, frames):
+        with self.lock:
+            self.frames.extend(frames)
+
+    def snapshot(self):
+        with self.lock:
+            if not self.frames:
+                return None
+            return np.concatenate(self.frames).astype(np.float32) / 32768.0
+
+
+class ContinuousCapture:
+    """Mic stream + ring buffer + energy VAD with a trailing-silence endpointer.
+
+    Frames are kept with their RMS energy and the noise floor at the time they arrived.
+    A frame counts as voice when its energy is `start_ratio` times the floor (`end_ratio`
+    once speech has started, for hysteresis). Speech starts after `onset_frames` voiced
+    frames in a row and ends after `trailing_silence` seconds without voice; `preroll`
+    seconds before the onset are kept so the first syllable is not clipped.
+    """
+    def __init__(self, ring_seconds=30, preroll=0.3, trailing_silence=0.7, onset_frames=3,
+                 start_ratio=3.0, end_ratio=2.0, min_energy=150.0, calibration=0.5,
+                 floor_adapt=0.05, floor_adapt_in_voice=0.002):
+        self.frame_size = SAMPLE_RATE * FRAME_MS // 1000
+        self.ring = collections.deque(maxlen=int(ring_seconds * 1000 / FRAME_MS))
+        self.preroll_frames = int(preroll * 1000 / FRAME_MS)
+        self.silence_frames = int(trailing_silence * 1000 / FRAME_MS)
+        self.onset_frames = onset_frames
+        self.start_ratio = start_ratio
+        self.end_ratio = end_ratio
+        self.min_energy = min_energy
+        self.calibration_frames = int(calibration * 1000 / FRAME_MS)
+        self.floor_adapt = floor_adapt
+        self.floor_adapt_in_voice = floor_adapt_in_voice
+        self.noise_floor = None
+        self.frame_count = 0  # total frames ever received; ring holds the newest ones
+        self.cond = threading.Condition()
+        self.closed = False
+        self.pa = None
+        self.stream = None
+
+    def start(self):
+        """Opens the default input device; frames flow into the ring buffer until close()."""
+        if self.stream is not None:
+            return
+        self.closed = False
+        import pyaudio
+        self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=SAMPLE_RATE, input=True,
+                                   frames_per_buffer=self.frame_size, stream_callback=self._on_audio)
+        self._continue = pyaudio.paContinue
+        self.stream.start_stream()
+
+    def close(self):
+        self.closed = True
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.pa.terminate()
+            self.stream = None
+        with self.cond:
+            self.cond.notify_all()
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        for offset in range(0, len(samples) - self.frame_size + 1, self.frame_size):
+            self.push(samples[offset:offset + self.frame_size])
+        return (None, self._continue)
+
+    def push(self, frame):
+        """Adds one frame to the ring buffer and updates the noise floor."""
+        rms = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+        with self.cond:
+            if self.frame_count < self.calibration_frames:
+                # One-time calibration when the stream opens: plain running mean
+                n = self.frame_count
+                self.noise_floor = rms if n == 0 else (self.noise_floor * n + rms) / (n + 1)
+            else:
+                voiced = rms > self._threshold(self.noise_floor, self.start_ratio)
+                rate = self.floor_adapt_in_voice if voiced else self.floor_adapt
+                # Drop quickly when the room gets quieter, rise slowly when it gets louder
+                if rms < self.noise_floor:
+                    rate = max(rate, 0.3)
+                self.noise_floor += rate * (rms - self.noise_floor)
+            self.ring.append((frame, rms, self.noise_floor))
+            self.frame_count += 1
+            self.cond.notify_all()
+
+    def _threshold(self, floor, ratio):
+        return max(floor * ratio, self.min_energy)
+
+    def _frame(self, index):
+        """Frame `index` (absolute) from the ring, or None if it has been overwritten. Needs cond."""
+        first = self.frame_count - len(self.ring)
+        if index < first:
+            return None
+        return self.ring[index - first]
+
+    def frames(self, timeout):
+        """Yields (index, frame, rms, floor) from now on; stops after `timeout` s without a new frame."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_count >= self.calibration_frames or self.closed,
+                               timeout=timeout)
+            index = self.frame_count
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.frame_count > index or self.closed,
+                                          timeout=timeout):
+                    return
+                if self.closed:
+                    return
+                index = max(index, self.frame_count - len(self.ring))
+                frame = self._frame(index)
+            yield (index, *frame)
+            index += 1
+
+    def capture_utterance(self, timeout=5.0, max_duration=8.0, utterance=None):
+        """Blocks until one utterance has been spoken and returns it as float32 16 kHz audio.
+
+        Returns None if no speech starts within `timeout` seconds. Speech is cut at
+        `max_duration` seconds, like SpeechRecognition's phrase_time_limit. If an Utterance
+        is passed, speech frames are published to it as they arrive and its stop event
+        ends the capture early.
+        """
+        utterance = utterance or Utterance()
+        frame_seconds = FRAME_MS / 1000
+        max_frames = int(max_duration / frame_seconds)
+        first = None
+        onset = None
+        run = 0
+        silence = 0
+        collected = []
+        for index, frame, rms, floor in self.frames(timeout=1.0):
+            if first is None:
+                first = index
+            if onset is None:
+                if utterance.stop.is_set():
+                    return None  # abandoned before the learner said anything
+                run = run + 1 if rms > self._threshold(floor, self.start_ratio) else 0
+                if run >= self.onset_frames:
+                    onset = index - run + 1
+                    # Pre-roll, but never from before this call (that was the AI speaking)
+                    with self.cond:
+                        start = max(first, onset - self.preroll_frames)
+                        kept = [self._frame(i) for i in range(start, index + 1)]
+                    collected = [entry[0] for entry in kept if entry is not None]
+                    utterance.extend(collected)
+                elif (index - first + 1) * frame_seconds >= timeout:
+                    return None
+                continue
+            collected.append(frame)
+            utterance.extend([frame])
+            silence = silence + 1 if rms <= self._threshold(floor, self.end_ratio) else 0
+            if silence >= self.silence_frames or index - onset + 1 >= max_frames or utterance.stop.is_set():
+                break
+        if onset is None or not collected:
+            return None
+        if silence:
+            collected = collected[:len(collected) - max(0, silence - self.preroll_frames)]
+        return np.concatenate(collected).astype(np.float32) / 32768.0
+
+
+def decode_wav(data):
+    """Converts a 16-bit PCM WAV file (e.g. a browser recording) to float32 16 kHz mono audio."""
+    with wave.open(io.BytesIO(data), "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"expected 16-bit PCM, got {8 * f.getsampwidth()}-bit")
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    audio = pcm.reshape(-1, channels).mean(axis=1).astype(np.float32) / 32768.0
+    if rate != SAMPLE_RATE and len(audio):
+        # Linear resampling is plenty for speech going into Whisper's 16 kHz log-mel frontend
+        positions = np.arange(int(len(audio) * SAMPLE_RATE / rate)) * rate / SAMPLE_RATE
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
@@ -0,0 +1 @@
+"""Headless benchmark harness: recorded answers in, latency/accuracy numbers out."""
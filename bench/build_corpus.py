@@ -0,0 +1,103 @@
+"""Builds the benchmark corpus.
+
+- corpus/tts/: every line the app speaks, rendered with the app's voice, for the TTS stand-in.
+- corpus/answers/<scenario>/<step>-<speaker>.wav: 16 kHz mono answers for each scenario line.
+
+Answers that already exist are kept, so recorded learner clips dropped in with the same
+naming take precedence; missing ones are synthesized with Indian-English neural voices.
+Needs network access to edge-tts once; the benchmark itself runs offline.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+import wave
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import edge_tts
+import numpy as np
+import pygame
+
+from app import get_services, VOICE, TTS_RATE, TTS_PITCH, prerender_texts
+from audio_capture import SAMPLE_RATE
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+ANSWER_VOICES = {"neerja": "en-IN-NeerjaNeural", "prabhat": "en-IN-PrabhatNeural"}
+
+
+async def synthesize(text, voice, rate="+0%", pitch="+0Hz"):
+    communicate = edge_tts.Communicate(text, voice, rate=rate, pitch=pitch)
+    chunks = [chunk["data"] async for chunk in communicate.stream() if chunk["type"] == "audio"]
+    return b"".join(chunks)
+
+
+def mp3_to_pcm16k(data):
+    """Decodes mp3 to 16 kHz mono int16 through the mixer, so no ffmpeg is needed.
+
+    The mixer decodes to its own format: a mixer that was already open at another rate or
+    channel count is down-mixed and resampled here rather than written out mislabelled.
+    """
+    mixer = pygame.mixer.get_init()
+    if mixer is None:
+        raise RuntimeError("pygame.mixer must be initialised before decoding mp3")
+    frequency, size, channels = mixer
+    if size != -16:
+        raise RuntimeError(f"mixer sample format {size} is not signed 16-bit")
+    samples = pygame.sndarray.array(pygame.mixer.Sound(file=io.BytesIO(data))).astype(np.float32)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    if frequency != SAMPLE_RATE:
+        length = int(round(len(samples) * SAMPLE_RATE / frequency))
+        samples = np.interp(np.arange(length) * frequency / SAMPLE_RATE, np.arange(len(samples)), samples)
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16).tobytes()
+
+
+def write_wav(path, pcm):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm)
+
+
+async def build(corpus_dir, force=False):
+    pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=1)
+
+    tts_dir = os.path.join(corpus_dir, "tts")
+    os.makedirs(tts_dir, exist_ok=True)
+    index = {}
+    for text in prerender_texts():
+        filename = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] + ".mp3"
+        path = os.path.join(tts_dir, filename)
+        if force or not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(await synthesize(text, VOICE, TTS_RATE, TTS_PITCH))
+        index[text] = filename
+    with open(os.path.join(tts_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+    written = 0
+    library = get_services().library
+    for key in library.scenarios:
+        for step, line in enumerate(library.dialogue(key)):
+            for speaker, voice in ANSWER_VOICES.items():
+                path = os.path.join(corpus_dir, "answers", key, f"{step}-{speaker}.wav")
+                if os.path.exists(path) and not force:
+                    continue
+                write_wav(path, mp3_to_pcm16k(await synthesize(line["user"], voice)))
+                written += 1
+    print(f"Corpus ready in {corpus_dir}: {len(index)} TTS line(s), {written} new answer clip(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the benchmark corpus")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--force", action="store_true", help="Re-synthesize existing files (recordings too)")
+    args = parser.parse_args()
+    asyncio.run(build(args.corpus, args.force))
@@ -0,0 +1,314 @@
+"""Headless end-to-end benchmark.
+
+    python -m bench.run [--out results.json]        run against the corpus
+    python -m bench.run compare base.json new.json  diff two runs
+
+Drives EnglishAI exactly as play_turn does (speak the AI line, listen, score, speak the
+feedback) with recorded answers replayed into the capture pipeline in real time and TTS
+served by the local stand-in. Audio output goes to SDL's dummy driver.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+
+import app
+from audio_capture import ContinuousCapture, FRAME_MS, SAMPLE_RATE
+from bench import tts_standin
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+PASS_SCORE = 80
+PERCENTILES = (50, 90, 95, 99)
+# Metrics where a larger value is better; everything else is a latency/cost
+HIGHER_IS_BETTER = {"scoring.accuracy", "stt_throughput.sequential_clips_per_second",
+                    "stt_throughput.concurrent_clips_per_second", "stt_throughput.speedup",
+                    "stt_throughput.mean_batch_size"}
+
+
+class ReplayCapture(ContinuousCapture):
+    """Capture pipeline fed from recorded clips instead of a microphone."""
+    def start(self):
+        pass
+
+    def replay(self, audio, lead=1.0, tail=1.5, noise=30.0):
+        """Pushes lead silence, the clip and tail silence in real time on a background thread.
+
+        Returns the thread and a dict whose "speech_end" is set (perf_counter) when the
+        clip's last frame has been pushed.
+        """
+        marks = {}
+        rng = np.random.default_rng(0)
+        pcm = (audio * 32768.0).astype(np.int16)
+        frame = self.frame_size
+
+        def silence(seconds):
+            return [rng.normal(0, noise, frame).astype(np.int16) for _ in range(int(seconds * 1000 / FRAME_MS))]
+
+        frames = silence(lead)
+        frames += [pcm[i:i + frame] for i in range(0, len(pcm) - frame + 1, frame)]
+        speech_end = len(frames)
+        frames += silence(tail)
+
+        def run():
+            start = time.perf_counter()
+            for i, f in enumerate(frames):
+                delay = start + i * FRAME_MS / 1000 - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.push(f)
+                if i + 1 == speech_end:
+                    marks["speech_end"] = time.perf_counter()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread, marks
+
+
+def read_wav(path):
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != SAMPLE_RATE or f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16 kHz mono 16-bit WAV")
+        pcm = f.readframes(f.getnframes())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def load_corpus(corpus_dir):
+    """Returns [(scenario key, step, clip id, audio)] for every answer clip present."""
+    clips = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "answers", "*", "*.wav"))):
+        scenario = os.path.basename(os.path.dirname(path))
+        name = os.path.splitext(os.path.basename(path))[0]
+        step = int(name.split("-")[0])
+        library = app.get_services().library
+        if scenario not in library or step >= len(library.dialogue(scenario)):
+            print(f"Skipping {path}: no matching scenario line")
+            continue
+        clips.append((scenario, step, f"{scenario}/{name}", read_wav(path)))
+    return clips
+
+
+def distribution(values):
+    if not values:
+        return None
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean"] = float(np.mean(values))
+    summary["n"] = len(values)
+    return summary
+
+
+async def measure_stt(engine, clips):
+    """Real-time factor of the bare worker transcription, and transcripts for scoring."""
+    samples = []
+    for scenario, step, clip_id, audio in clips:
+        answers = engine.services.library.dialogue(scenario)[step]["answers"]
+        start = time.perf_counter()
+        result = await engine.services.stt.transcribe(audio, answers=answers)
+        elapsed = time.perf_counter() - start
+        samples.append({"clip": clip_id, "scenario": scenario, "step": step, "text": result["text"],
+                        "model": result["model"], "escalated": result["escalated"],
+                        "seconds": elapsed, "rtf": elapsed / (len(audio) / SAMPLE_RATE)})
+    return samples
+
+
+def escalation_rate(stt_samples):
+    """Share of cascade attempts re-run on the main model (None without a cascade)."""
+    tried = [s for s in stt_samples if s["escalated"] or s["model"] == app.STT_CASCADE_MODEL]
+    return sum(s["escalated"] for s in tried) / len(tried) if tried else None
+
+
+async def measure_throughput(engine, clips):
+    """Clips per second with every clip submitted at once (as a busy classroom would) against
+    the sequential rate, showing what the worker's dynamic batching gains."""
+    stt = engine.services.stt
+    start = time.perf_counter()
+    for clip in clips:
+        await stt.transcribe(clip[3])
+    sequential = len(clips) / (time.perf_counter() - start)
+    stt.batch_sizes.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(stt.transcribe(clip[3]) for clip in clips))
+    concurrent = len(clips) / (time.perf_counter() - start)
+    return {
+        "sequential_clips_per_second": sequential,
+        "concurrent_clips_per_second": concurrent,
+        "speedup": concurrent / sequential,
+        "mean_batch_size": stt.mean_batch_size(),
+    }
+
+
+def measure_scoring(engine, stt_samples):
+    """Each transcript should pass its own line and fail a different line of its scenario."""
+    correct = false_rejects = false_accepts = 0
+    for sample in stt_samples:
+        dialogue = engine.services.library.dialogue(sample["scenario"])
+        own = dialogue[sample["step"]]
+        other = dialogue[(sample["step"] + 1) % len(dialogue)]
+        passed = engine.check_similarity(sample["text"], own) >= PASS_SCORE
+        wrongly_passed = other is not own and engine.check_similarity(sample["text"], other) >= PASS_SCORE
+        false_rejects += not passed
+        false_accepts += wrongly_passed
+        correct += passed + (not wrongly_passed)
+    trials = 2 * len(stt_samples)
+    return {
+        "accuracy": correct / trials if trials else None,
+        "false_reject_rate": false_rejects / len(stt_samples) if stt_samples else None,
+        "false_accept_rate": false_accepts / len(stt_samples) if stt_samples else None,
+        "n": trials,
+    }
+
+
+async def measure_turns(engine, clips):
+    """One play_turn per clip: AI line, learner answer, score, spoken feedback."""
+    turns = []
+    for scenario, step, clip_id, audio in clips:
+        line = engine.services.library.dialogue(scenario)[step]
+        await engine.speak(line["ai"])
+        ai_ttfa = engine.last_playback_stats["ttfa"]
+
+        thread, marks = engine.mic.replay(audio)
+        user_text = await engine.listen(line)
+        scored = time.perf_counter()
+        score = engine.check_similarity(user_text, line)
+        thread.join()  # replay the tail so the next turn starts from silence
+        speech_end = marks.get("speech_end", scored)
+
+        feedback_start = time.perf_counter()
+        await engine.speak(app.PRAISE if score >= PASS_SCORE else app.RETRY_PROMPT)
+        feedback_ttfa = engine.last_playback_stats["ttfa"] or 0.0
+        turns.append({
+            "clip": clip_id, "text": user_text, "score": score,
+            "ai_ttfa": ai_ttfa,
+            "feedback_ttfa": feedback_ttfa,
+            # Negative when the answer was accepted before the clip even finished
+            "response_latency": scored - speech_end,
+            "turn_latency": feedback_start + feedback_ttfa - speech_end,
+        })
+    return turns
+
+
+async def run(args):
+    clips = load_corpus(args.corpus)
+    if not clips:
+        sys.exit(f"No answer clips under {args.corpus}/answers; run python -m bench.build_corpus first")
+
+    runner, endpoint = await tts_standin.start(
+        tts_standin.load_index(os.path.join(args.corpus, "tts")),
+        latency=args.tts_latency, bytes_per_second=args.tts_bytes_per_second)
+    app.TTS_ENDPOINT = endpoint
+    engine = app.EnglishAI()
+    engine.services.tts_cache = app.TTSCache(tempfile.mkdtemp(prefix="bench-tts-"))
+    engine.mic = ReplayCapture(trailing_silence=app.LISTEN_TRAILING_SILENCE)
+    if args.batch_window is not None:
+        engine.services.stt.batch_window = args.batch_window
+
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, engine.load_model)
+    stt_ready = time.perf_counter() - started
+    try:
+        stt_samples = await measure_stt(engine, clips)
+        throughput = await measure_throughput(engine, clips)
+        turns = await measure_turns(engine, clips)
+    finally:
+        engine.services.stt.stop()
+        await runner.cleanup()
+
+    ms = lambda values: [v * 1000 for v in values if v is not None]
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "stt_engine": app.STT_ENGINE, "stt_model": app.STT_MODEL_SIZE, "stt_profile": app.STT_PROFILE,
+            "stt_cascade_model": app.STT_CASCADE_MODEL,
+            "clips": len(clips),
+            "tts_latency": args.tts_latency,
+            "stt_ready_seconds": stt_ready,
+        },
+        "summary": {
+            "stt_rtf": distribution([s["rtf"] for s in stt_samples]),
+            "stt_throughput": throughput,
+            "stt_escalation_rate": escalation_rate(stt_samples),
+            "tts_ttfa_ms": distribution(ms([t["ai_ttfa"] for t in turns] + [t["feedback_ttfa"] for t in turns])),
+            "scoring": measure_scoring(engine, stt_samples),
+            "response_latency_ms": distribution(ms([t["response_latency"] for t in turns])),
+            "turn_latency_ms": distribution(ms([t["turn_latency"] for t in turns])),
+        },
+        "stt": stt_samples,
+        "turns": turns,
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Wrote {args.out}")
+    else:
+        print(output)
+
+
+def flatten(summary, prefix=""):
+    flat = {}
+    for key, value in summary.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not name.endswith(".n"):
+            flat[name] = value
+    return flat
+
+
+def compare(args):
+    """Prints per-metric changes; exits 1 if any metric regressed by more than the tolerance."""
+    with open(args.base, encoding="utf-8") as f:
+        base = flatten(json.load(f)["summary"])
+    with open(args.new, encoding="utf-8") as f:
+        new = flatten(json.load(f)["summary"])
+    regressions = []
+    print(f"{'metric':34} {'base':>12} {'new':>12} {'change':>9}")
+    for name in sorted(set(base) & set(new)):
+        old, cur = base[name], new[name]
+        # A zero baseline (e.g. no false accepts) has no relative change: use the absolute one
+        change = (cur - old) / abs(old) if old else cur - old
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = ""
+        if worse > args.tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        shown = f"{change:+9.1%}" if old else f"{change:+9.3f}"
+        print(f"{name:34} {old:12.3f} {cur:12.3f} {shown}{flag}")
+    if regressions:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="English Practice AI benchmark")
+    sub = parser.add_subparsers(dest="command")
+    diff = sub.add_parser("compare", help="Compare two result files")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--tolerance", type=float, default=0.10,
+                      help="Allowed regression: relative, or absolute where the base is 0 (default 0.10)")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--out", help="Write results JSON here instead of stdout")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="Stand-in first-byte latency (s)")
+    parser.add_argument("--tts-bytes-per-second", type=int, default=24000)
+    parser.add_argument("--batch-window", type=float, help="STT batching window (s) for this run")
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
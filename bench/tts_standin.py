@@ -0,0 +1,68 @@
+"""Local stand-in for edge-tts.
+
+Serves pre-rendered mp3s from the corpus (bench/corpus/tts) over HTTP with a configurable
+first-byte latency and throughput, so TTS numbers are reproducible and need no network.
+Point the app at it with TTS_ENDPOINT=http://127.0.0.1:<port>/synthesize.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from aiohttp import web
+
+DEFAULT_TTS_DIR = os.path.join(os.path.dirname(__file__), "corpus", "tts")
+
+
+def load_index(tts_dir):
+    """Maps line text to its mp3 bytes, from the index.json written by build_corpus.py."""
+    with open(os.path.join(tts_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    audio = {}
+    for text, filename in index.items():
+        with open(os.path.join(tts_dir, filename), "rb") as f:
+            audio[text] = f.read()
+    return audio
+
+
+def make_app(audio, latency=0.15, chunk_bytes=4096, bytes_per_second=24000):
+    """latency: delay before the first byte; bytes_per_second: streaming speed after that
+    (edge-tts mp3 is 6000 bytes per second of speech, so the default is 4x real time)."""
+    async def synthesize(request):
+        data = audio.get(request.query.get("text", ""))
+        if data is None:
+            raise web.HTTPNotFound(text="no pre-rendered audio for this text")
+        response = web.StreamResponse(headers={"Content-Type": "audio/mpeg"})
+        await response.prepare(request)
+        await asyncio.sleep(latency)
+        for offset in range(0, len(data), chunk_bytes):
+            await response.write(data[offset:offset + chunk_bytes])
+            await asyncio.sleep(chunk_bytes / bytes_per_second)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/synthesize", synthesize)
+    return app
+
+
+async def start(audio, host="127.0.0.1", port=0, **options):
+    """Starts the stand-in in the running loop; returns (runner, endpoint URL)."""
+    runner = web.AppRunner(make_app(audio, **options))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}/synthesize"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local edge-tts stand-in for benchmarks")
+    parser.add_argument("--tts-dir", default=DEFAULT_TTS_DIR)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--bytes-per-second", type=int, default=24000)
+    args = parser.parse_args()
+    web.run_app(make_app(load_index(args.tts_dir), latency=args.latency,
+                         bytes_per_second=args.bytes_per_second),
+                host="127.0.0.1", port=args.port)
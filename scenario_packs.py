@@ -0,0 +1,165 @@
+"""Scenario packs: practice dialogues stored on disk instead of in source.
+
+A pack is a directory:
+
+    pack.json             index: {"name", "scenarios": [{"key", "title", "icon", "desc", "file"}]}
+    dialogues/<key>.json  {"normalizer": N, "dialogue": [{"ai", "user", "accept"?, "answers"?}]}
+    tts/<cache key>.mp3   optional pre-rendered AI lines, named like TTSCache keys
+
+Only the indexes are read at startup, which is enough to draw the selection grid. A
+dialogue is read when its scenario is opened, and its pre-normalized "answers" are used
+as-is when they were written with the current NORMALIZER_VERSION.
+"""
+import json
+import os
+import sys
+from collections import OrderedDict
+
+from answer_matching import NORMALIZER_VERSION, accepted_answers
+
+PACK_INDEX = "pack.json"
+INDEX_FIELDS = ("key", "title", "icon", "desc")
+
+
+class ScenarioLibrary:
+    """Index of every scenario in a set of pack directories, with an LRU of loaded dialogues.
+
+    Each directory is either a pack itself or holds packs as subdirectories. A key that
+    appears in more than one pack is kept from the first one.
+    """
+    def __init__(self, directories, max_dialogues=32):
+        self.scenarios = OrderedDict()  # key -> index entry plus "pack" and "path"
+        self.packs = []
+        self.max_dialogues = max_dialogues
+        self.dialogues = OrderedDict()
+        for directory in directories:
+            self._scan(directory)
+
+    def _scan(self, directory):
+        if os.path.isfile(os.path.join(directory, PACK_INDEX)):
+            self._load_index(directory)
+            return
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, PACK_INDEX)):
+                self._load_index(entry.path)
+
+    def _load_index(self, directory):
+        path = os.path.join(directory, PACK_INDEX)
+        try:
+            with open(path, encoding="utf-8") as f:
+                index = json.load(f)
+            scenarios = index["scenarios"]
+            for scenario in scenarios:
+                missing = [field for field in INDEX_FIELDS + ("file",) if field not in scenario]
+                if missing:
+                    raise ValueError(f"scenario entry missing {', '.join(missing)}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Skipping scenario pack {directory}: {e}")
+            return
+        self.packs.append(directory)
+        for scenario in scenarios:
+            key = scenario["key"]
+            if key in self.scenarios:
+                print(f"Scenario {key!r} in {directory} already loaded from {self.scenarios[key]['pack']}")
+                continue
+            info = {field: scenario[field] for field in INDEX_FIELDS}
+            info["pack"] = directory
+            info["path"] = os.path.join(directory, scenario["file"])
+            self.scenarios[key] = info
+
+    def __contains__(self, key):
+        return key in self.scenarios
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def info(self, key):
+        """Index entry of a scenario: key, title, icon and desc (no dialogue)."""
+        return self.scenarios[key]
+
+    def page(self, number, size):
+        """Index entries of one page of the selection grid (0-based)."""
+        keys = list(self.scenarios)[number * size:(number + 1) * size]
+        return [self.scenarios[key] for key in keys]
+
+    def page_count(self, size):
+        return max(1, -(-len(self.scenarios) // size))
+
+    def page_of(self, key, size):
+        return list(self.scenarios).index(key) // size
+
+    def dialogue(self, key):
+        """Lines of a scenario, each with its normalized "answers", read from disk on first use."""
+        lines = self.dialogues.get(key)
+        if lines is not None:
+            self.dialogues.move_to_end(key)
+            return lines
+        lines = load_dialogue(self.scenarios[key]["path"])
+        self.dialogues[key] = lines
+        while len(self.dialogues) > self.max_dialogues:
+            self.dialogues.popitem(last=False)
+        return lines
+
+    def tts_dirs(self):
+        """Pre-rendered audio directories bundled with the loaded packs."""
+        return [os.path.join(pack, "tts") for pack in self.packs if os.path.isdir(os.path.join(pack, "tts"))]
+
+    def texts(self):
+        """Every AI line of every scenario, in order. Reads all dialogues."""
+        texts = [line["ai"] for key in self.scenarios for line in self.dialogue(key)]
+        return list(dict.fromkeys(texts))
+
+
+def load_dialogue(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    lines = data["dialogue"]
+    # Answers written by another version of normalize() may no longer match transcripts
+    if data.get("normalizer") != NORMALIZER_VERSION or any("answers" not in line for line in lines):
+        for line in lines:
+            line["answers"] = accepted_answers(line)
+    return lines
+
+
+def write_pack(directory, name, scenarios):
+    """Writes scenarios ({key: {"title", "icon", "desc", "dialogue"}}) as a pack, with the
+    normalized answers of every line pre-computed."""
+    index = {"name": name, "scenarios": []}
+    for key, scenario in scenarios.items():
+        filename = scenario.get("file", f"dialogues/{key}.json")
+        entry = {field: scenario[field] for field in INDEX_FIELDS if field != "key"}
+        index["scenarios"].append({"key": key, **entry, "file": filename})
+        dialogue = [dict(line, answers=accepted_answers(line)) for line in scenario["dialogue"]]
+        path = os.path.join(directory, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_json(path, {"normalizer": NORMALIZER_VERSION, "dialogue": dialogue})
+    _write_json(os.path.join(directory, PACK_INDEX), index)
+
+
+def normalize_pack(directory):
+    """Re-computes the stored answers of every dialogue in a pack with the current normalizer."""
+    with open(os.path.join(directory, PACK_INDEX), encoding="utf-8") as f:
+        index = json.load(f)
+    scenarios = OrderedDict()
+    for scenario in index["scenarios"]:
+        with open(os.path.join(directory, scenario["file"]), encoding="utf-8") as f:
+            scenarios[scenario["key"]] = dict(scenario, dialogue=json.load(f)["dialogue"])
+    write_pack(directory, index.get("name", os.path.basename(directory)), scenarios)
+    return len(scenarios)
+
+
+def _write_json(path, data):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(path + ".part", path)
+
+
+if __name__ == "__main__":
+    # python scenario_packs.py <pack dir>...: refresh pre-normalized answers after editing dialogues
+    for directory in sys.argv[1:]:
+        print(f"{directory}: {normalize_pack(directory)} scenarios")
@@ -0,0 +1,193 @@
+"""Speech-to-text engines the STT worker can host, and the decode profiles they accept.
+
+Engines are selected by name (STT_ENGINE in app.py). Each one takes a float32 16 kHz
+mono array and returns {"text", "avg_logprob", "no_speech_prob"}.
+"""
+
+# Engine-neutral decode settings. The library defaults (no profile options) run language
+# detection and temperature fallback, sampling 5 candidates at every fallback temperature;
+# faster-whisper also runs a 5-wide beam search (openai-whisper already decodes greedily).
+# That is wasted work on short, known-English answers.
+DECODE_PROFILES = {
+    # Library defaults: most robust, slowest
+    "accurate": {},
+    # Skip language detection
+    "english": {"language": "en"},
+    # English, greedy, one sample per fallback temperature instead of 5; fallback still enabled
+    "greedy": {"language": "en", "beam_size": 1, "best_of": 1},
+    # English, greedy, one temperature (no fallback), no timestamp tokens and no
+    # conditioning on previous text: the cheapest decode, tuned for answers of a few seconds
+    "short-phrase": {
+        "language": "en",
+        "beam_size": 1,
+        "temperature": 0.0,
+        "condition_on_previous_text": False,
+        "without_timestamps": True,
+    },
+}
+
+
+# What openai-whisper's transcribe() falls back through, and when, unless a profile says otherwise
+WHISPER_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+WHISPER_THRESHOLDS = {"compression_ratio_threshold": 2.4, "logprob_threshold": -1.0,
+                      "no_speech_threshold": 0.6}
+
+
+def resolve_profile(name):
+    try:
+        return DECODE_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown decode profile {name!r}; choose one of {', '.join(DECODE_PROFILES)}")
+
+
+def _summarize(text, segments):
+    """Collapses per-segment scores into one result dict."""
+    logprobs = [s["avg_logprob"] for s in segments]
+    no_speech = [s["no_speech_prob"] for s in segments]
+    return {
+        "text": text.strip(),
+        "avg_logprob": sum(logprobs) / len(logprobs) if logprobs else float("-inf"),
+        "no_speech_prob": max(no_speech) if no_speech else 1.0,
+    }
+
+
+class STTBackend:
+    """Base class for engines. load() runs once in the worker before any transcribe().
+
+    threads caps the CPU threads used by one inference; interop_threads only applies to
+    engines that run on torch.
+    """
+    name = None
+
+    def __init__(self, model_size, threads=1, interop_threads=1):
+        self.model_size = model_size
+        self.threads = threads
+        self.interop_threads = interop_threads
+
+    def load(self):
+        raise NotImplementedError
+
+    def transcribe(self, audio, profile):
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios, profile):
+        """Transcribes several clips with one profile. Engines that can run them through the
+        model together override this; the fallback decodes them one by one."""
+        return [self.transcribe(audio, profile) for audio in audios]
+
+
+class WhisperBackend(STTBackend):
+    """Reference openai-whisper model: fp16 on CUDA, fp32 on CPU."""
+    name = "whisper"
+
+    def load(self):
+        import torch
+        import whisper
+        torch.set_num_threads(self.threads)
+        # Can only be set once per process, before any parallel work (a cascade loads two models)
+        if torch.get_num_interop_threads() != self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:
+                pass
+        self.model = whisper.load_model(self.model_size)
+        # Asking for fp16 on CPU only produces a warning and a silent fallback to fp32
+        self.fp16 = self.model.device.type == "cuda"
+
+    def transcribe(self, audio, profile):
+        options = dict(profile)
+        if options.get("beam_size") == 1:
+            options["beam_size"] = None  # whisper spells greedy decoding as "no beam"
+        result = self.model.transcribe(audio, fp16=self.fp16, **options)
+        return _summarize(result["text"], result["segments"])
+
+    @staticmethod
+    def _temperatures(profile):
+        temperature = profile.get("temperature", WHISPER_TEMPERATURES)
+        return tuple(temperature) if isinstance(temperature, (list, tuple)) else (temperature,)
+
+    @classmethod
+    def _batchable(cls, audios, profile):
+        # A greedy first pass over single-window clips is exactly what whisper.decode() does for a
+        # batch, whatever follows it. Beam search and long audio need transcribe()'s per-clip loop.
+        import whisper
+        return (len(audios) > 1 and cls._temperatures(profile)[0] == 0
+                and profile.get("beam_size") in (None, 1)
+                and all(len(audio) <= whisper.audio.N_SAMPLES for audio in audios))
+
+    @staticmethod
+    def _needs_fallback(decoded, profile):
+        """transcribe()'s test for retrying a window at the next temperature."""
+        limits = {name: profile.get(name, default) for name, default in WHISPER_THRESHOLDS.items()}
+        if limits["logprob_threshold"] is not None and decoded.avg_logprob < limits["logprob_threshold"]:
+            no_speech = limits["no_speech_threshold"]
+            return no_speech is None or decoded.no_speech_prob <= no_speech  # else: silence
+        ratio = limits["compression_ratio_threshold"]
+        return ratio is not None and decoded.compression_ratio > ratio
+
+    def transcribe_batch(self, audios, profile):
+        """Pads every clip to Whisper's 30 s window and runs the encoder and the greedy first pass
+        once over the whole batch. Only clips that pass would fall back on (too repetitive or
+        unsure, not silent) are re-decoded one by one at the profile's higher temperatures."""
+        if not self._batchable(audios, profile):
+            return super().transcribe_batch(audios, profile)
+        import torch
+        import whisper
+        n_mels = self.model.dims.n_mels
+        mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=n_mels)
+                           for audio in audios]).to(self.model.device)
+        options = whisper.DecodingOptions(
+            language=profile.get("language"), temperature=0.0,
+            without_timestamps=profile.get("without_timestamps", False), fp16=self.fp16)
+        temperatures = self._temperatures(profile)
+        results = []
+        for audio, decoded in zip(audios, whisper.decode(self.model, mel, options)):
+            if len(temperatures) > 1 and self._needs_fallback(decoded, profile):
+                # The greedy pass is already spent; transcribe() carries on from the next temperature
+                results.append(self.transcribe(audio, dict(profile, temperature=temperatures[1:])))
+                continue
+            # Same silence rule transcribe() applies with its default thresholds
+            silent = decoded.no_speech_prob > 0.6 and decoded.avg_logprob < -1.0
+            results.append({
+                "text": "" if silent else decoded.text.strip(),
+                "avg_logprob": decoded.avg_logprob,
+                "no_speech_prob": decoded.no_speech_prob,
+            })
+        return results
+
+
+class FasterWhisperBackend(STTBackend):
+    """CTranslate2 Whisper with int8-quantized weights: several times faster on CPU for a
+    small accuracy cost. Needs the optional `faster-whisper` package."""
+    name = "faster-whisper"
+
+    def __init__(self, model_size, threads=1, interop_threads=1, compute_type="int8"):
+        super().__init__(model_size, threads, interop_threads)
+        self.compute_type = compute_type
+
+    def load(self):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("STT engine 'faster-whisper' needs: pip install faster-whisper")
+        self.model = WhisperModel(self.model_size, device="cpu", compute_type=self.compute_type,
+                                  cpu_threads=self.threads)
+
+    def transcribe(self, audio, profile):
+        options = dict(profile)
+        segments, _ = self.model.transcribe(audio, **options)
+        segments = list(segments)  # decoding is lazy until the generator is consumed
+        text = "".join(s.text for s in segments)
+        return _summarize(text, [{"avg_logprob": s.avg_logprob, "no_speech_prob": s.no_speech_prob}
+                                 for s in segments])
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, FasterWhisperBackend)}
+
+
+def create_backend(engine, model_size, threads=1, interop_threads=1):
+    try:
+        backend = BACKENDS[engine]
+    except KeyError:
+        raise ValueError(f"Unknown STT engine {engine!r}; choose one of {', '.join(BACKENDS)}")
+    return backend(model_size, threads, interop_threads)
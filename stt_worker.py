@@ -0,0 +1,479 @@
+"""Out-of-process speech-to-text worker.
+
+Whisper/torch inference runs in its own long-lived process so it never shares the GIL
+or the CPU scheduler slot of the Flet event loop. Audio travels over shared memory;
+only small (kind, request_id, payload) tuples go through the queues.
+"""
+import asyncio
+import collections
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stt_backends import create_backend, resolve_profile
+
+SAMPLE_RATE = 16000
+
+
+class STTWorkerError(RuntimeError):
+    """Raised to callers when the worker fails a request or dies while handling it."""
+
+
+class _BatchCost:
+    """Running estimate of how long a decode of n clips takes, learned from past batches."""
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.seconds = {}  # batch size -> exponential moving average
+
+    def observe(self, size, seconds):
+        previous = self.seconds.get(size)
+        self.seconds[size] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def estimate(self, size):
+        if size in self.seconds:
+            return self.seconds[size]
+        smaller = [known for known in self.seconds if known < size]
+        if not smaller:
+            return 0.0
+        # Scale linearly from the nearest smaller batch: an upper bound, since batching is sublinear
+        known = max(smaller)
+        return self.seconds[known] * size / known
+
+
+def _read_audio(shm_name, length):
+    # The client created the block and unlinks it once the result is back
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return np.ndarray((length,), dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+# A transcription waiting in the worker; `answers` are the expected line's normalized answers
+_Pending = collections.namedtuple("_Pending", "request_id audio profile answers escalate received")
+
+
+def _decode(backend, audios, profile):
+    """transcribe_batch(), retried one by one on failure so a single bad clip only fails its
+    own caller; failed entries are returned as exceptions."""
+    try:
+        return backend.transcribe_batch(audios, profile)
+    except Exception:
+        results = []
+        for audio in audios:
+            try:
+                results.append(backend.transcribe(audio, profile))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def _worker_main(requests, responses, engine, model_size, profile, torch_threads, interop_threads,
+                 batch_window, max_batch, latency_slo, cascade):
+    # Startup stages are reported so the UI can show progress while the model loads
+    responses.put(("progress", None, {"stage": "importing"}))
+    backend = create_backend(engine, model_size, torch_threads, interop_threads)
+    responses.put(("progress", None, {"stage": "loading model"}))
+    backend.load()
+    default_profile = resolve_profile(profile)
+    cost = _BatchCost()
+    responses.put(("progress", None, {"stage": "warming up"}))
+    # Warm-up pass so the first real request does not pay for lazy kernel/allocator setup
+    started = time.monotonic()
+    backend.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), default_profile)
+    cost.observe(1, time.monotonic() - started)
+    fast = None
+    if cascade is not None:
+        from answer_matching import best_match
+        fast_size, min_logprob, min_score = cascade
+        responses.put(("progress", None, {"stage": "loading cascade model"}))
+        fast = create_backend(engine, fast_size, torch_threads, interop_threads)
+        fast.load()
+        fast.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), default_profile)
+    responses.put(("ready", None, {"pid": os.getpid()}))
+
+    backlog = collections.deque()
+    stopping = False
+
+    def accept(message):
+        """Queues a transcription, answers pings at once; returns True for stop."""
+        kind, request_id, payload = message
+        if kind == "stop":
+            return True
+        if kind == "ping":
+            responses.put(("pong", request_id, {"pid": os.getpid()}))
+        else:
+            try:
+                shm_name, length, profile_name, answers, escalate = payload
+                # Grouped by the profile that will actually run: a request without one uses the
+                # worker's default and batches with requests that name it
+                profile_name = profile_name or profile
+                resolve_profile(profile_name)
+                backlog.append(_Pending(request_id, _read_audio(shm_name, length), profile_name,
+                                        answers, escalate, time.monotonic()))
+            except Exception as e:
+                responses.put(("error", request_id, repr(e)))
+        return False
+
+    def confident(result, answers):
+        return (result["avg_logprob"] >= min_logprob
+                and best_match(result["text"], answers)[0] >= min_score)
+
+    while backlog or not stopping:
+        if not backlog:
+            stopping = accept(requests.get())
+            continue
+        # Batch the oldest request with later ones that use the same profile. Keep collecting
+        # until the batch is full, the window since the oldest arrival is over, or waiting any
+        # longer would make the oldest miss its latency SLO given what a bigger batch costs.
+        profile_name, oldest = backlog[0].profile, backlog[0].received
+        while not stopping:
+            size = sum(1 for item in backlog if item.profile == profile_name)
+            if size >= max_batch:
+                break
+            flush_at = min(oldest + batch_window, oldest + latency_slo - cost.estimate(size + 1))
+            wait = flush_at - time.monotonic()
+            try:
+                # Requests that are already queued are always drained, even with no window
+                stopping = accept(requests.get(timeout=wait) if wait > 0 else requests.get_nowait())
+            except queue.Empty:
+                break
+        batch = [item for item in backlog if item.profile == profile_name][:max_batch]
+        for item in batch:
+            backlog.remove(item)
+
+        decode_profile = resolve_profile(profile_name)
+        started = time.monotonic()
+        results = [None] * len(batch)
+        # Cascade: answers with an expected line go through the small model first and keep its
+        # transcript when it is confident and matches; the rest are re-decoded by the main
+        # model from the same audio array
+        tried = [i for i, item in enumerate(batch) if fast is not None and item.answers]
+        if tried:
+            for i, result in zip(tried, _decode(fast, [batch[i].audio for i in tried], decode_profile)):
+                if not isinstance(result, Exception) and (not batch[i].escalate
+                                                          or confident(result, batch[i].answers)):
+                    results[i] = dict(result, model=fast_size, escalated=False)
+        rest = [i for i, result in enumerate(results) if result is None]
+        if rest:
+            for i, result in zip(rest, _decode(backend, [batch[i].audio for i in rest], decode_profile)):
+                results[i] = result if isinstance(result, Exception) else \
+                    dict(result, model=model_size, escalated=i in tried)
+        cost.observe(len(batch), time.monotonic() - started)
+        for item, result in zip(batch, results):
+            if isinstance(result, Exception):
+                responses.put(("error", item.request_id, repr(result)))
+                continue
+            result.update(batch_size=len(batch), queue_wait=started - item.received)
+            responses.put(("result", item.request_id, result))
+
+
+class STTWorker:
+    """Async client for the Whisper worker process.
+
+    Starts the process, waits for its warm-up, routes results back to the awaiting
+    coroutine and restarts the process (resubmitting in-flight requests once) if it dies.
+    A worker that dies before it ever became ready is not restarted: that is a broken
+    install (e.g. whisper missing), not a crash, and `error` says why.
+
+    A worker that is alive but stuck is replaced too: a transcription that takes longer than
+    `timeout_base` plus `timeout_per_second` per second of audio queued up to and including
+    it (at most `request_timeout`) restarts it, and an idle worker that does not answer a
+    ping every `health_interval` seconds is restarted before the next answer waits on it.
+
+    Concurrent requests are batched in the worker: the oldest waiting request is decoded
+    together with up to `max_batch` - 1 others that arrive within `batch_window` seconds,
+    and the batch is flushed early if waiting would push the oldest past `latency_slo`.
+
+    With `cascade_model` set (e.g. "tiny"), requests that name their expected answers are
+    first decoded by that smaller model; its transcript is kept if the average log-probability
+    is at least `cascade_min_logprob` and it matches an answer with at least
+    `cascade_min_score`, otherwise the main model re-decodes the same audio. The cascade
+    model must differ from `model_size`: results are told apart by the model that made them.
+    """
+    def __init__(self, model_size, engine="whisper", profile="accurate",
+                 torch_threads=1, interop_threads=1, request_timeout=60.0,
+                 timeout_base=5.0, timeout_per_second=2.0, health_interval=10.0,
+                 batch_window=0.0, max_batch=8, latency_slo=2.0,
+                 cascade_model=None, cascade_min_logprob=-0.5, cascade_min_score=85):
+        self.model_size = model_size
+        self.engine = engine
+        self.profile = profile
+        self.torch_threads = torch_threads
+        self.interop_threads = interop_threads
+        self.request_timeout = request_timeout
+        self.timeout_base = timeout_base
+        self.timeout_per_second = timeout_per_second
+        self.health_interval = health_interval
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.latency_slo = latency_slo
+        self.batch_sizes = collections.Counter()  # batch size -> results delivered from such batches
+        self.max_queue_depth = 0
+        if cascade_model is not None and cascade_model == model_size:
+            raise ValueError(f"cascade_model must be smaller than the main model, not {model_size!r} too")
+        self.cascade_model = cascade_model
+        self.cascade_min_logprob = cascade_min_logprob
+        self.cascade_min_score = cascade_min_score
+        self.cascade = collections.Counter()  # "accepted" / "escalated" / "direct" final results
+        self.ctx = mp.get_context("spawn")
+        self.process = None
+        self.requests = None
+        self.ready = threading.Event()
+        self.settled = threading.Event()  # set once the worker is either ready or has failed to start
+        self.error = None
+        self.status = "stopped"  # startup stage reported by the worker, then "ready" / "failed"
+        self.lock = threading.Lock()
+        self.pending = {}  # request id -> [loop, future, kind, payload, attempts, generation]
+        self.ids = itertools.count()
+        self.restarts = 0
+        self.generation = 0  # bumped by every spawn, so a hung process is restarted only once
+        self.stopping = False
+
+    def start(self):
+        with self.lock:
+            self._spawn()
+        if self.health_interval:
+            threading.Thread(target=self._watch, name="stt-worker-watchdog", daemon=True).start()
+
+    def _spawn(self):
+        # Caller holds self.lock
+        self.generation += 1
+        self.ready.clear()
+        self.settled.clear()
+        self.error = None
+        self.status = "starting"
+        self.requests = self.ctx.Queue()
+        responses = self.ctx.Queue()
+        self.process = self.ctx.Process(
+            target=_worker_main, name="stt-worker", daemon=True,
+            args=(self.requests, responses, self.engine, self.model_size, self.profile,
+                  self.torch_threads, self.interop_threads,
+                  self.batch_window, self.max_batch, self.latency_slo,
+                  (self.cascade_model, self.cascade_min_logprob, self.cascade_min_score)
+                  if self.cascade_model else None))
+        self.process.start()
+        threading.Thread(target=self._read_responses, args=(self.process, responses),
+                         name="stt-worker-reader", daemon=True).start()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the worker is warmed up; False if it failed to start or timed out."""
+        self.settled.wait(timeout)
+        return self.ready.is_set()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self):
+        self.stopping = True
+        if self.is_alive():
+            self.requests.put(("stop", None, None))
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+
+    def restart(self, generation=None):
+        """Kills the current process (if any) and starts a fresh one, resubmitting pending work.
+
+        With a generation, nothing happens unless that process is still the current one: several
+        requests timing out on the same hung worker replace it once, not once each.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self.process is not None and self.process.is_alive():
+                self.process.kill()
+            self._recover()
+
+    def _recover(self):
+        # Caller holds self.lock
+        self.restarts += 1
+        print(f"STT worker restarting (restart #{self.restarts})")
+        self._spawn()
+        for request_id, entry in list(self.pending.items()):
+            loop, future, kind, payload, attempts, _ = entry
+            if attempts >= 1:
+                del self.pending[request_id]
+                self._fail(entry, "STT worker crashed while handling the request")
+                continue
+            # Keeps its original generation: its timeout started on the old process and says
+            # nothing about the new one
+            entry[4] += 1
+            self.requests.put((kind, request_id, payload))
+
+    def _fail(self, entry, message):
+        loop, future = entry[0], entry[1]
+        loop.call_soon_threadsafe(self._settle, future, None, STTWorkerError(message))
+
+    def _read_responses(self, process, responses):
+        while True:
+            try:
+                kind, request_id, payload = responses.get(timeout=0.5)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                with self.lock:
+                    # Only the reader of the current process may recover it
+                    if self.stopping or process is not self.process:
+                        return
+                    if self.ready.is_set():
+                        self._recover()
+                        return
+                    self.error = f"STT worker exited during startup (exit code {process.exitcode})"
+                    self.status = "failed"
+                    print(self.error)
+                    for entry in self.pending.values():
+                        self._fail(entry, self.error)
+                    self.pending.clear()
+                    self.settled.set()
+                return
+            except (EOFError, OSError):
+                return
+            if kind == "progress":
+                self.status = payload["stage"]
+                continue
+            if kind == "ready":
+                self.status = "ready"
+                self.ready.set()
+                self.settled.set()
+                continue
+            with self.lock:
+                entry = self.pending.pop(request_id, None)
+            if entry is None:
+                continue  # the caller gave up (timeout or cancellation)
+            if kind == "result":
+                self.batch_sizes[payload.get("batch_size", 1)] += 1
+                if payload.get("escalated"):
+                    self.cascade["escalated"] += 1
+                elif payload.get("model") != self.cascade_model:
+                    self.cascade["direct"] += 1
+                elif entry[3][4]:  # kept by the confidence check, not a provisional partial
+                    self.cascade["accepted"] += 1
+            loop, future = entry[0], entry[1]
+            error = STTWorkerError(payload) if kind == "error" else None
+            loop.call_soon_threadsafe(self._settle, future, payload, error)
+
+    @staticmethod
+    def _settle(future, result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def _request(self, kind, payload, timeout, restart_on_timeout=False):
+        if self.error is not None:
+            raise STTWorkerError(self.error)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request_id = next(self.ids)
+        with self.lock:
+            entry = self.pending[request_id] = [loop, future, kind, payload, 0, self.generation]
+            self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+            self.requests.put((kind, request_id, payload))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if not restart_on_timeout:
+                raise
+            # A hung inference never comes back; replace the process rather than wait on it.
+            # Dropped first, so the restart does not hand the same request to the new process
+            with self.lock:
+                self.pending.pop(request_id, None)
+            self.restart(entry[5])
+            raise STTWorkerError("STT worker timed out")
+        finally:
+            with self.lock:
+                self.pending.pop(request_id, None)
+
+    async def ping(self, timeout=2.0):
+        """Health check: True if the worker is warmed up and answers within timeout."""
+        if not self.ready.is_set() or not self.is_alive():
+            return False
+        try:
+            await self._request("ping", None, timeout)
+            return True
+        except (asyncio.TimeoutError, STTWorkerError):
+            return False
+
+    def check_health(self, timeout=2.0):
+        """Pings an idle, running worker and restarts it if it does not answer; False if it did.
+
+        A busy worker answers pings only between batches, so it is left to its requests'
+        own timeouts.
+        """
+        generation = self.generation
+        if self.stopping or self.pending or not self.ready.is_set() or not self.is_alive():
+            return True
+        if asyncio.run(self.ping(timeout)):
+            return True
+        with self.lock:
+            if self.pending:
+                return True  # a request came in and held the ping up
+        print("STT worker did not answer its health check; restarting")
+        self.restart(generation)
+        return False
+
+    def _watch(self):
+        while not self.stopping:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+    def health(self):
+        return {
+            "alive": self.is_alive(),
+            "ready": self.ready.is_set(),
+            "pid": self.process.pid if self.process is not None else None,
+            "status": self.status,
+            "restarts": self.restarts,
+            "pending": len(self.pending),
+            "max_queue_depth": self.max_queue_depth,
+            "mean_batch_size": self.mean_batch_size(),
+            "cascade": dict(self.cascade),
+            "escalation_rate": self.escalation_rate(),
+            "error": self.error,
+        }
+
+    def escalation_rate(self):
+        """Share of cascade attempts the small model was not sure enough about."""
+        tried = self.cascade["accepted"] + self.cascade["escalated"]
+        return self.cascade["escalated"] / tried if tried else 0.0
+
+    def request_timeout_for(self, length):
+        """Seconds a transcription of `length` samples may take, given the audio queued before it."""
+        with self.lock:
+            queued = sum(entry[3][1] for entry in self.pending.values() if entry[2] == "transcribe")
+        seconds = (queued + length) / SAMPLE_RATE
+        return min(self.request_timeout, self.timeout_base + self.timeout_per_second * seconds)
+
+    def mean_batch_size(self):
+        """Average size of the batch each delivered result was decoded in."""
+        delivered = sum(self.batch_sizes.values())
+        if not delivered:
+            return 0.0
+        return sum(size * count for size, count in self.batch_sizes.items()) / delivered
+
+    async def transcribe(self, audio, profile=None, answers=None, escalate=True):
+        """Transcribes a float32 16 kHz mono array in the worker.
+
+        Returns {"text", "avg_logprob", "no_speech_prob", "model", "escalated", "batch_size",
+        "queue_wait"}; profile overrides the worker's default decode profile for this request
+        only. answers (normalized expected answers) let the cascade try its small model first;
+        with escalate=False its transcript is returned as is (cheap provisional partials).
+        """
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+        try:
+            np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+            return await self._request("transcribe", (shm.name, len(audio), profile, answers, escalate),
+                                       self.request_timeout_for(len(audio)), restart_on_timeout=True)
+        finally:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,79 @@
+import pytest
+
+from answer_matching import accepted_answers, best_match, normalize
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("You're welcome!", "you are welcome"),
+    ("I'd like a table for two.", "i would like a table for 2"),
+    ("It's at 6:45 p.m.", "it is at 6 45 pm"),
+    ("six forty-five pm", "6 45 pm"),
+    ("Six o'clock", "6"),
+    ("6:00pm", "6 pm"),
+    ("The 3rd floor", "the 3 floor"),
+    ("the third floor", "the 3 floor"),
+    ("twenty first", "21"),
+    ("one hundred and five", "100 and 5"),
+    ("Um, okay, Mr Smith", "ok mister smith"),
+    ("I can't", "i can not"),
+    ("I cannot", "i can not"),
+    ("", ""),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+def test_accepted_answers_are_normalized_and_deduplicated():
+    line = {"ai": "Ready?", "user": "Yes, I'm ready.", "accept": ["yes I am ready", "Ready!"]}
+    assert accepted_answers(line) == ["yes i am ready", "ready"]
+
+
+def test_best_match_exact_after_normalization():
+    assert best_match("you're welcome", [normalize("You are welcome.")]) == (100, "you are welcome")
+
+
+def test_best_match_picks_the_closest_answer():
+    answers = [normalize("Yes, please."), normalize("A table for two, please.")]
+    score, answer = best_match("a table for 2 please", answers)
+    assert (score, answer) == (100, "a table for 2 please")
+
+
+def test_best_match_answer_inside_longer_utterance():
+    score, answer = best_match("yes please thank you", [normalize("Yes please")])
+    assert answer == "yes please"
+    assert 80 <= score < 100
+
+
+@pytest.mark.parametrize("user_text", [None, "", "   ", "um uh"])
+def test_best_match_empty_transcript(user_text):
+    assert best_match(user_text, [normalize("Yes please")]) == (0, None)
+
+
+def test_best_match_no_answers():
+    assert best_match("yes please", []) == (0, None)
+
+
+def test_best_match_rejects_reordered_words():
+    score, _ = best_match("welcome you are", [normalize("You are welcome")])
+    assert score < 80
+
+
+@pytest.mark.parametrize("user_text, expected", [
+    ("I do not want a table for two", "I want a table for two"),
+    ("I am not hungry", "I am hungry"),
+    ("No thank you", "Yes thank you"),
+    ("I am hungry", "I am not hungry"),
+    ("I never said that", "I said that"),
+])
+def test_best_match_rejects_a_different_negation(user_text, expected):
+    score, _ = best_match(user_text, [normalize(expected)])
+    assert score < 80
+
+
+def test_best_match_accepts_matching_negation():
+    score, _ = best_match("I don't know", [normalize("I do not know")])
+    assert score == 100
+
+
+def test_best_match_cannot_is_cant():
+    assert best_match("I cannot come", [normalize("I can't come")]) == (100, "i can not come")
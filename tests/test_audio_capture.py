@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from audio_capture import FRAME_MS, SAMPLE_RATE, ContinuousCapture, Utterance
+
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
+rng = np.random.default_rng(0)
+
+
+def quiet(count):
+    return [rng.normal(0, 50, FRAME).astype(np.int16) for _ in range(count)]
+
+
+def loud(count):
+    t = np.arange(FRAME) / SAMPLE_RATE
+    return [(3000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16) for _ in range(count)]
+
+
+def calibrated():
+    capture = ContinuousCapture(preroll=0.3, trailing_silence=0.7)
+    for frame in quiet(capture.calibration_frames):
+        capture.push(frame)
+    return capture
+
+
+def feed(capture, frames, on_frame=None):
+    """Pushes frames as the mic callback would and makes the next capture read them from the
+    ring, as if they arrived live after it started."""
+    start = capture.frame_count
+    for frame in frames:
+        capture.push(frame)
+
+    def frames_from_start(timeout):
+        for index in range(start, capture.frame_count):
+            if on_frame is not None:
+                on_frame(index - start)
+            yield (index, *capture._frame(index))
+    capture.frames = frames_from_start
+
+
+def test_utterance_keeps_preroll_and_trims_trailing_silence():
+    capture = calibrated()
+    feed(capture, quiet(20) + loud(30) + quiet(40))
+    audio = capture.capture_utterance(timeout=5.0)
+    # 10 frames of pre-roll, the speech, and as much trailing silence as pre-roll
+    assert capture.preroll_frames == 10
+    assert len(audio) == (10 + 30 + 10) * FRAME
+    level = np.abs(audio.reshape(-1, FRAME)).max(axis=1)
+    assert (level[:10] < 0.02).all() and (level[10:40] > 0.05).all() and (level[40:] < 0.02).all()
+
+
+def test_preroll_never_reaches_before_the_call():
+    capture = calibrated()
+    feed(capture, loud(30) + quiet(40))
+    audio = capture.capture_utterance(timeout=5.0)
+    assert len(audio) == (30 + 10) * FRAME
+    assert np.abs(audio[:FRAME]).max() > 0.05
+
+
+def test_no_speech_within_timeout():
+    capture = calibrated()
+    feed(capture, quiet(20) + loud(30))
+    assert capture.capture_utterance(timeout=0.3) is None
+
+
+def test_short_bursts_are_not_an_onset():
+    capture = calibrated()
+    feed(capture, (loud(2) + quiet(3)) * 10)
+    assert capture.capture_utterance(timeout=5.0) is None
+
+
+def test_speech_is_cut_at_max_duration():
+    capture = calibrated()
+    utterance = Utterance()
+    feed(capture, loud(100))
+    audio = capture.capture_utterance(timeout=5.0, max_duration=1.5, utterance=utterance)
+    assert len(audio) == 50 * FRAME
+    # Everything captured was published to the utterance as it arrived
+    assert np.array_equal(utterance.snapshot(), audio)
+
+
+def test_stop_before_speech_abandons_the_capture():
+    capture = calibrated()
+    utterance = Utterance()
+    utterance.stop.set()
+    feed(capture, quiet(5) + loud(30))
+    assert capture.capture_utterance(timeout=5.0, utterance=utterance) is None
+
+
+@pytest.mark.parametrize("stop_at", [15, 25])
+def test_stop_during_speech_ends_the_capture(stop_at):
+    capture = calibrated()
+    utterance = Utterance()
+
+    def on_frame(offset):
+        if offset == stop_at:
+            utterance.stop.set()
+
+    feed(capture, loud(100), on_frame=on_frame)
+    audio = capture.capture_utterance(timeout=5.0, utterance=utterance)
+    assert len(audio) == (stop_at + 1) * FRAME
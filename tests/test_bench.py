@@ -0,0 +1,128 @@
+import json
+import os
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from bench import build_corpus, tts_standin
+from bench.run import CORPUS_DIR, compare, distribution, flatten, load_corpus, read_wav
+
+
+def test_distribution():
+    summary = distribution([1.0, 2.0, 3.0, 4.0])
+    assert summary["n"] == 4
+    assert summary["mean"] == 2.5
+    assert summary["p50"] == 2.5
+    assert summary["p99"] == pytest.approx(3.97)
+
+
+def test_distribution_empty():
+    assert distribution([]) is None
+
+
+def test_flatten_skips_counts_and_non_numbers():
+    summary = {
+        "stt_rtf": {"p50": 0.2, "mean": 0.25, "n": 10},
+        "scoring": {"accuracy": 0.9, "false_accept_rate": 0.0, "n": 20},
+        "stt_escalation_rate": None,
+        "note": "text",
+    }
+    assert flatten(summary) == {
+        "stt_rtf.p50": 0.2, "stt_rtf.mean": 0.25,
+        "scoring.accuracy": 0.9, "scoring.false_accept_rate": 0.0,
+    }
+
+
+def _compare(tmp_path, base, new, tolerance=0.10):
+    paths = []
+    for name, summary in (("base.json", base), ("new.json", new)):
+        path = tmp_path / name
+        path.write_text(json.dumps({"summary": summary}), encoding="utf-8")
+        paths.append(str(path))
+    compare(SimpleNamespace(base=paths[0], new=paths[1], tolerance=tolerance))
+
+
+def test_compare_within_tolerance(tmp_path, capsys):
+    _compare(tmp_path, {"turn_latency_ms": {"p50": 1000.0}}, {"turn_latency_ms": {"p50": 1050.0}})
+    assert "REGRESSION" not in capsys.readouterr().out
+
+
+def test_compare_flags_slower_latency(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        _compare(tmp_path, {"turn_latency_ms": {"p50": 1000.0}}, {"turn_latency_ms": {"p50": 1200.0}})
+    assert exit_info.value.code == 1
+    assert "turn_latency_ms.p50" in capsys.readouterr().out
+
+
+def test_compare_higher_is_better(tmp_path, capsys):
+    _compare(tmp_path, {"scoring": {"accuracy": 0.80}}, {"scoring": {"accuracy": 0.95}})
+    assert "REGRESSION" not in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        _compare(tmp_path, {"scoring": {"accuracy": 0.95}}, {"scoring": {"accuracy": 0.80}})
+
+
+def test_compare_zero_base_uses_absolute_change(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        _compare(tmp_path, {"scoring": {"false_accept_rate": 0.0}}, {"scoring": {"false_accept_rate": 0.5}})
+    assert "+0.500" in capsys.readouterr().out
+    _compare(tmp_path, {"scoring": {"false_accept_rate": 0.0}}, {"scoring": {"false_accept_rate": 0.05}})
+    assert "REGRESSION" not in capsys.readouterr().out
+
+
+def test_seed_corpus_loads():
+    clips = load_corpus(CORPUS_DIR)
+    assert clips
+    for scenario, step, clip_id, audio in clips:
+        assert audio.dtype == np.float32 and len(audio) > 0
+    audio = tts_standin.load_index(os.path.join(CORPUS_DIR, "tts"))
+    assert "Good job!" in audio and all(data for data in audio.values())
+
+
+def test_read_wav_rejects_other_formats(tmp_path):
+    path = str(tmp_path / "stereo.wav")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(b"\0" * 400)
+    with pytest.raises(ValueError):
+        read_wav(path)
+
+
+@pytest.fixture
+def mixer():
+    def init(frequency, channels):
+        pygame.mixer.quit()
+        pygame.mixer.init(frequency=frequency, size=-16, channels=channels)
+    yield init
+    pygame.mixer.quit()
+
+
+def _seed_mp3():
+    with open(os.path.join(CORPUS_DIR, "tts", "index.json"), encoding="utf-8") as f:
+        filename = json.load(f)["Good job!"]
+    with open(os.path.join(CORPUS_DIR, "tts", filename), "rb") as f:
+        return f.read()
+
+
+def test_mp3_to_pcm16k_resamples_other_mixer_formats(mixer):
+    data = _seed_mp3()
+    mixer(16000, 1)
+    reference = np.frombuffer(build_corpus.mp3_to_pcm16k(data), dtype=np.int16)
+    mixer(44100, 2)
+    resampled = np.frombuffer(build_corpus.mp3_to_pcm16k(data), dtype=np.int16)
+    # Same duration to within the decoders' padding (20 ms), not 44.1 kHz stereo mislabelled as 16 kHz
+    assert abs(len(resampled) - len(reference)) <= 320
+    assert np.abs(resampled).max() > 0
+
+
+def test_mp3_to_pcm16k_needs_the_mixer():
+    pygame.mixer.quit()
+    with pytest.raises(RuntimeError):
+        build_corpus.mp3_to_pcm16k(b"")
@@ -0,0 +1,117 @@
+import asyncio
+import glob
+import io
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from app import (MIXER_CHANNELS, MIXER_FREQUENCY, EnglishAI, Mp3StreamDecoder, SpeechServices,
+                 SynthesisProgress, TTSCache, mp3_complete_frames, mp3_frame_offsets)
+from bench.run import CORPUS_DIR
+from scenario_packs import ScenarioLibrary
+
+# A corpus line: 24 kHz mono 48 kbit/s, the format edge-tts streams
+LINE = sorted(glob.glob(os.path.join(CORPUS_DIR, "tts", "*.mp3")))[-1]
+
+
+@pytest.fixture
+def mixer():
+    pygame.mixer.quit()
+    pygame.mixer.init(frequency=MIXER_FREQUENCY, channels=MIXER_CHANNELS, size=-16)
+    yield
+    pygame.mixer.quit()
+
+
+def samples(sound):
+    return np.frombuffer(sound.get_raw(), dtype=np.int16) if sound is not None else np.zeros(0, np.int16)
+
+
+def test_complete_frames_stops_before_a_partial_frame():
+    with open(LINE, "rb") as f:
+        data = f.read()
+    offsets = mp3_frame_offsets(data)
+    assert offsets[:3] == [0, 144, 288]
+    assert mp3_complete_frames(data[:offsets[3] + 10]) == offsets[3]
+    assert mp3_complete_frames(data) == len(data)
+    assert mp3_complete_frames(b"ID3 not a frame") == 0
+
+
+def test_segments_join_without_gaps(mixer):
+    with open(LINE, "rb") as f:
+        data = f.read()
+    whole = samples(pygame.mixer.Sound(file=io.BytesIO(data)))
+    offsets = mp3_frame_offsets(data)
+    # Uneven cuts, including a one-frame segment
+    cuts = [0] + [offsets[i] for i in (20, 50, 51, 90, 130)] + [len(data)]
+    decoder = Mp3StreamDecoder()
+    joined = np.concatenate([samples(decoder.decode(data[start:end]))
+                             for start, end in zip(cuts, cuts[1:])])
+    assert len(joined) == len(whole) == len(offsets) * 576
+    assert np.abs(joined.astype(np.int32) - whole).max() <= 2
+
+
+def test_segment_without_frames(mixer):
+    assert Mp3StreamDecoder().decode(b"\x00" * 100) is None
+
+
+async def collect(chunks):
+    return [data async for data in chunks]
+
+
+def test_progress_replays_what_arrived_and_follows_the_rest():
+    async def scenario():
+        progress = SynthesisProgress()
+        progress.append(b"ab")
+        reader = asyncio.ensure_future(collect(progress.chunks()))
+        await asyncio.sleep(0)
+        progress.append(b"cd")
+        await asyncio.sleep(0)
+        progress.append(b"e")
+        progress.finish()
+        return await reader
+
+    assert asyncio.run(scenario()) == [b"ab", b"cd", b"e"]
+
+
+def test_progress_raises_what_the_synthesis_raised():
+    async def scenario():
+        progress = SynthesisProgress()
+        progress.append(b"ab")
+        progress.finish(OSError("connection reset"))
+        with pytest.raises(OSError):
+            await collect(progress.chunks())
+
+    asyncio.run(scenario())
+
+
+def test_speak_plays_along_with_a_running_prefetch(mixer, tmp_path):
+    with open(LINE, "rb") as f:
+        data = f.read()
+    data = data[:mp3_frame_offsets(data)[24]]  # about half a second
+    requests = []
+
+    async def tts_chunks(text):
+        requests.append(text)
+        for start in range(0, len(data), 1000):
+            await asyncio.sleep(0.01)
+            yield data[start:start + 1000]
+
+    async def scenario():
+        services = SpeechServices(ScenarioLibrary([]))
+        services.tts_cache = TTSCache(directory=str(tmp_path))
+        services.tts_chunks = tts_chunks
+        engine = EnglishAI(services)
+        services.prefetch("Hello!")
+        stats = await engine._play("Hello!")
+        return services, stats
+
+    services, stats = asyncio.run(scenario())
+    assert stats["mode"] == "stream+prefetch" and stats["ttfa"] is not None
+    assert requests == ["Hello!"]
+    assert services.tts_cache.get(TTSCache.key("Hello!")) == data
+    assert not services.progress and not services.inflight
@@ -0,0 +1,166 @@
+import json
+import os
+
+import pytest
+
+import scenario_packs
+from answer_matching import NORMALIZER_VERSION
+from scenario_packs import PACK_INDEX, ScenarioLibrary, load_dialogue, normalize_pack, write_pack
+
+CORE_PACK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scenarios", "core")
+
+
+def scenario(title, *lines):
+    return {"title": title, "icon": "star", "desc": f"{title} practice",
+            "dialogue": [{"ai": ai, "user": user} for ai, user in lines]}
+
+
+@pytest.fixture
+def packs(tmp_path):
+    """Two packs under one directory; "shared" is in both."""
+    write_pack(str(tmp_path / "a"), "A", {
+        "cafe": scenario("Cafe", ("What would you like?", "A coffee, please.")),
+        "shared": scenario("Shared A", ("Hello!", "Hi.")),
+    })
+    write_pack(str(tmp_path / "b"), "B", {
+        "shared": scenario("Shared B", ("Hello!", "Hello.")),
+        "bank": scenario("Bank", ("Next please.", "I'd like to open an account."),
+                         ("Which kind?", "A savings account.")),
+    })
+    return tmp_path
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_write_pack_layout(packs):
+    index = read_json(packs / "a" / PACK_INDEX)
+    assert index["name"] == "A"
+    assert index["scenarios"][0] == {"key": "cafe", "title": "Cafe", "icon": "star",
+                                     "desc": "Cafe practice", "file": "dialogues/cafe.json"}
+    dialogue = read_json(packs / "a" / "dialogues" / "cafe.json")
+    assert dialogue["normalizer"] == NORMALIZER_VERSION
+    assert dialogue["dialogue"][0]["answers"] == ["a coffee please"]
+
+
+def test_library_scans_packs_in_order_and_keeps_the_first_duplicate(packs):
+    library = ScenarioLibrary([str(packs)])
+    assert list(library.scenarios) == ["cafe", "shared", "bank"]
+    assert library.info("shared")["title"] == "Shared A"
+    assert len(library) == 3 and "bank" in library and "zoo" not in library
+
+
+def test_library_accepts_a_pack_directory_itself(packs):
+    library = ScenarioLibrary([str(packs / "b"), str(packs / "missing")])
+    assert list(library.scenarios) == ["shared", "bank"]
+
+
+def test_library_skips_broken_packs(packs):
+    broken = packs / "c"
+    broken.mkdir()
+    (broken / PACK_INDEX).write_text(json.dumps({"scenarios": [{"key": "x", "title": "X"}]}))
+    library = ScenarioLibrary([str(packs)])
+    assert "x" not in library
+    assert str(broken) not in library.packs
+
+
+def test_library_pages(packs):
+    library = ScenarioLibrary([str(packs)])
+    assert [info["key"] for info in library.page(0, 2)] == ["cafe", "shared"]
+    assert [info["key"] for info in library.page(1, 2)] == ["bank"]
+    assert library.page_count(2) == 2
+    assert library.page_count(9) == 1
+    assert library.page_of("bank", 2) == 1
+    assert ScenarioLibrary([]).page_count(9) == 1
+
+
+def test_library_reads_dialogues_lazily_with_an_lru(packs, monkeypatch):
+    reads = []
+    original = scenario_packs.load_dialogue
+    monkeypatch.setattr(scenario_packs, "load_dialogue", lambda path: reads.append(path) or original(path))
+    library = ScenarioLibrary([str(packs)], max_dialogues=2)
+    assert reads == []
+    assert library.dialogue("bank")[1]["answers"] == ["a savings account"]
+    library.dialogue("bank")
+    assert len(reads) == 1
+    library.dialogue("cafe")
+    library.dialogue("bank")  # most recently used, so "cafe" is evicted next
+    library.dialogue("shared")
+    assert list(library.dialogues) == ["bank", "shared"]
+    library.dialogue("cafe")
+    assert len(reads) == 4
+
+
+def test_library_texts_and_tts_dirs(packs):
+    (packs / "b" / "tts").mkdir()
+    library = ScenarioLibrary([str(packs)])
+    assert library.texts() == ["What would you like?", "Hello!", "Next please.", "Which kind?"]
+    assert library.tts_dirs() == [str(packs / "b" / "tts")]
+
+
+def write_dialogue(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def test_load_dialogue_uses_current_answers_as_stored(tmp_path):
+    path = str(tmp_path / "d.json")
+    write_dialogue(path, {"normalizer": NORMALIZER_VERSION,
+                          "dialogue": [{"ai": "Hi", "user": "Hello.", "answers": ["as stored"]}]})
+    assert load_dialogue(path)[0]["answers"] == ["as stored"]
+
+
+@pytest.mark.parametrize("normalizer", [None, NORMALIZER_VERSION - 1, NORMALIZER_VERSION + 1])
+def test_load_dialogue_recomputes_answers_of_another_normalizer(tmp_path, normalizer):
+    path = str(tmp_path / "d.json")
+    data = {"dialogue": [{"ai": "Hi", "user": "You're welcome.", "accept": ["My pleasure!"],
+                          "answers": ["stale"]}]}
+    if normalizer is not None:
+        data["normalizer"] = normalizer
+    write_dialogue(path, data)
+    assert load_dialogue(path)[0]["answers"] == ["you are welcome", "my pleasure"]
+
+
+def test_load_dialogue_fills_in_missing_answers(tmp_path):
+    path = str(tmp_path / "d.json")
+    write_dialogue(path, {"normalizer": NORMALIZER_VERSION, "dialogue": [
+        {"ai": "Hi", "user": "Hello.", "answers": ["hello"]},
+        {"ai": "When?", "user": "At 6:45 p.m."},
+    ]})
+    assert [line["answers"] for line in load_dialogue(path)] == [["hello"], ["at 6 45 pm"]]
+
+
+def test_normalize_pack_round_trip(packs):
+    path = packs / "b" / "dialogues" / "bank.json"
+    data = read_json(path)
+    # Edited by hand: a new accepted answer and stale answers from an older normalizer
+    data["normalizer"] = NORMALIZER_VERSION - 1
+    data["dialogue"][0]["accept"] = ["I want to open an account"]
+    data["dialogue"][1]["answers"] = ["stale"]
+    write_dialogue(path, data)
+    index = read_json(packs / "b" / PACK_INDEX)
+
+    assert normalize_pack(str(packs / "b")) == 2
+    assert read_json(packs / "b" / PACK_INDEX) == index
+    refreshed = read_json(path)
+    assert refreshed["normalizer"] == NORMALIZER_VERSION
+    assert refreshed["dialogue"][0]["accept"] == ["I want to open an account"]
+    assert refreshed["dialogue"][0]["answers"] == ["i would like to open an account", "i want to open an account"]
+    assert refreshed["dialogue"][1]["answers"] == ["a savings account"]
+    assert not any(name.endswith(".part") for name in os.listdir(packs / "b" / "dialogues"))
+
+    # Normalizing again changes nothing
+    normalize_pack(str(packs / "b"))
+    assert read_json(path) == refreshed
+
+
+def test_core_pack_answers_are_current():
+    library = ScenarioLibrary([CORE_PACK])
+    assert len(library) >= 3
+    for key in library.scenarios:
+        stored = read_json(library.info(key)["path"])
+        assert stored["normalizer"] == NORMALIZER_VERSION
+        for line in stored["dialogue"]:
+            assert line["answers"] == scenario_packs.accepted_answers(line)
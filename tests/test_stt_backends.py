@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from stt_backends import DECODE_PROFILES, WhisperBackend, resolve_profile
+
+
+def decoded(text="yes please", avg_logprob=-0.2, no_speech_prob=0.01, compression_ratio=1.0):
+    return SimpleNamespace(text=text, avg_logprob=avg_logprob, no_speech_prob=no_speech_prob,
+                           compression_ratio=compression_ratio)
+
+
+@pytest.mark.parametrize("result, expected", [
+    (decoded(), False),
+    (decoded(avg_logprob=-1.5), True),                         # unsure
+    (decoded(compression_ratio=3.0), True),                    # repetitive
+    (decoded(avg_logprob=-1.5, no_speech_prob=0.9), False),    # silence
+    (decoded(compression_ratio=3.0, avg_logprob=-1.5, no_speech_prob=0.9), False),
+])
+def test_needs_fallback_follows_transcribe(result, expected):
+    assert WhisperBackend._needs_fallback(result, resolve_profile("accurate")) is expected
+
+
+def test_profile_thresholds_override_the_defaults():
+    profile = dict(resolve_profile("accurate"), logprob_threshold=None)
+    assert WhisperBackend._needs_fallback(decoded(avg_logprob=-1.5), profile) is False
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """A WhisperBackend whose batched pass returns the queued results and whose per-clip
+    transcribe() records the profiles it was given."""
+    whisper = pytest.importorskip("whisper")
+    backend = WhisperBackend("base")
+    backend.model = SimpleNamespace(dims=SimpleNamespace(n_mels=80), device="cpu")
+    backend.fp16 = False
+    backend.queued = []
+    backend.retried = []
+    monkeypatch.setattr(whisper, "decode", lambda model, mel, options: backend.queued[:len(mel)])
+
+    def transcribe(audio, profile):
+        backend.retried.append(profile)
+        return {"text": "fallback", "avg_logprob": -0.3, "no_speech_prob": 0.0}
+    backend.transcribe = transcribe
+    return backend
+
+
+def clips(count):
+    return [np.zeros(16000, dtype=np.float32) for _ in range(count)]
+
+
+@pytest.mark.parametrize("profile", list(DECODE_PROFILES))
+def test_every_profile_batches_its_greedy_pass(backend, profile):
+    backend.queued = [decoded(), decoded(text="no thanks")]
+    results = backend.transcribe_batch(clips(2), resolve_profile(profile))
+    assert [result["text"] for result in results] == ["yes please", "no thanks"]
+    assert backend.retried == []
+
+
+def test_only_clips_that_fail_the_greedy_pass_fall_back(backend):
+    backend.queued = [decoded(), decoded(avg_logprob=-1.5), decoded(avg_logprob=-1.5, no_speech_prob=0.9)]
+    results = backend.transcribe_batch(clips(3), resolve_profile("accurate"))
+    assert [result["text"] for result in results] == ["yes please", "fallback", ""]
+    # The retry skips the temperature the batch already tried
+    assert [profile["temperature"] for profile in backend.retried] == [(0.2, 0.4, 0.6, 0.8, 1.0)]
+
+
+def test_single_temperature_profile_never_falls_back(backend):
+    backend.queued = [decoded(avg_logprob=-1.5), decoded()]
+    results = backend.transcribe_batch(clips(2), resolve_profile("short-phrase"))
+    assert results[0]["text"] == "yes please" and backend.retried == []
+
+
+def test_beam_search_and_long_audio_decode_one_by_one(backend):
+    backend.transcribe_batch(clips(2), {"beam_size": 5})
+    backend.transcribe_batch([np.zeros(16000 * 31, dtype=np.float32)] * 2, resolve_profile("accurate"))
+    assert len(backend.retried) == 4
@@ -0,0 +1,134 @@
+import os
+import queue
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from multiprocessing import shared_memory
+
+import stt_worker
+
+
+class FakeBackend:
+    """Records every batch it decodes instead of running a model."""
+    batches = []
+
+    def __init__(self, model_size, threads=1, interop_threads=1):
+        self.model_size = model_size
+
+    def load(self):
+        pass
+
+    def transcribe(self, audio, profile):
+        return self.transcribe_batch([audio], profile)[0]
+
+    def transcribe_batch(self, audios, profile):
+        FakeBackend.batches.append((self.model_size, len(audios), dict(profile)))
+        return [{"text": "you are welcome", "avg_logprob": -0.1, "no_speech_prob": 0.0} for _ in audios]
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Runs _worker_main in-process on the given queued messages; returns its responses."""
+    monkeypatch.setattr(stt_worker, "create_backend", lambda engine, size, *threads: FakeBackend(size))
+    FakeBackend.batches = []
+    blocks = []
+
+    def transcribe(request_id, profile=None, answers=None):
+        audio = np.zeros(1600, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=audio.nbytes)
+        blocks.append(shm)
+        return ("transcribe", request_id, (shm.name, len(audio), profile, answers, True))
+
+    def run(messages, profile="short-phrase", cascade=None):
+        requests, responses = queue.Queue(), queue.Queue()
+        for message in messages + [("stop", None, None)]:
+            requests.put(message)
+        stt_worker._worker_main(requests, responses, "whisper", "base", profile, 1, 1,
+                                0.0, 8, 2.0, cascade)
+        results = []
+        while not responses.empty():
+            results.append(responses.get())
+        return [message for message in results if message[0] not in ("progress", "ready")]
+
+    yield transcribe, run
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+def test_default_and_named_profile_share_a_batch(worker):
+    transcribe, run = worker
+    results = run([transcribe(0), transcribe(1, "short-phrase"), transcribe(2)])
+    assert [kind for kind, _, _ in results] == ["result"] * 3
+    assert {payload["batch_size"] for _, _, payload in results} == {3}
+    # Warm-up, then one batch of all three
+    assert [size for _, size, _ in FakeBackend.batches] == [1, 3]
+
+
+def test_different_profiles_are_batched_apart(worker):
+    transcribe, run = worker
+    results = run([transcribe(0), transcribe(1, "accurate"), transcribe(2)])
+    sizes = {request_id: payload["batch_size"] for _, request_id, payload in results}
+    assert sizes == {0: 2, 1: 1, 2: 2}
+
+
+def test_unknown_profile_fails_only_its_request(worker):
+    transcribe, run = worker
+    results = run([transcribe(0, "loud"), transcribe(1)])
+    assert [(kind, request_id) for kind, request_id, _ in results] == [("error", 0), ("result", 1)]
+
+
+def test_cascade_model_must_differ_from_the_main_model():
+    with pytest.raises(ValueError):
+        stt_worker.STTWorker("base", cascade_model="base")
+    assert stt_worker.STTWorker("base", cascade_model="tiny").cascade_model == "tiny"
+
+
+def test_importing_app_builds_no_state():
+    # spawn re-imports the parent's main script in the worker as __mp_main__; a fresh
+    # interpreter, since other tests build the app's state in this one
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    check = "import app, sys; sys.exit(app._services is not None or app.ai_engine is not None)"
+    assert subprocess.run([sys.executable, "-c", check], cwd=root, timeout=60).returncode == 0
+
+
+def test_request_timeout_scales_with_queued_audio():
+    worker = stt_worker.STTWorker("base", request_timeout=60.0, timeout_base=5.0, timeout_per_second=2.0)
+    second = stt_worker.SAMPLE_RATE
+    assert worker.request_timeout_for(3 * second) == 11.0
+    worker.pending[0] = [None, None, "transcribe", ("shm", 10 * second, None, None, True), 0, 1]
+    worker.pending[1] = [None, None, "ping", None, 0, 1]
+    assert worker.request_timeout_for(3 * second) == 31.0
+    assert worker.request_timeout_for(60 * second) == 60.0
+
+
+@pytest.fixture
+def idle_worker(monkeypatch):
+    worker = stt_worker.STTWorker("base")
+    worker.ready.set()
+    worker.restarted = []
+    monkeypatch.setattr(worker, "is_alive", lambda: True)
+    monkeypatch.setattr(worker, "restart", lambda generation=None: worker.restarted.append(generation))
+    return worker
+
+
+@pytest.mark.parametrize("answers", [True, False])
+def test_health_check_restarts_an_unresponsive_worker(idle_worker, monkeypatch, answers):
+    async def ping(timeout):
+        return answers
+
+    monkeypatch.setattr(idle_worker, "ping", ping)
+    assert idle_worker.check_health() is answers
+    assert idle_worker.restarted == ([] if answers else [idle_worker.generation])
+
+
+def test_health_check_leaves_a_busy_worker_alone(idle_worker, monkeypatch):
+    async def ping(timeout):
+        raise AssertionError("a busy worker must not be pinged")
+
+    monkeypatch.setattr(idle_worker, "ping", ping)
+    idle_worker.pending[0] = [None, None, "transcribe", ("shm", 16000, None, None, True), 0, 1]
+    assert idle_worker.check_health() is True
+    assert idle_worker.restarted == []
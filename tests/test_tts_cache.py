@@ -0,0 +1,68 @@
+import os
+
+from app import TTSCache
+
+
+def make_cache(tmp_path, **limits):
+    return TTSCache(directory=str(tmp_path / "cache"), **limits)
+
+
+def test_key_depends_on_the_voice():
+    assert TTSCache.key("Hello") == TTSCache.key("Hello")
+    assert TTSCache.key("Hello") != TTSCache.key("Hello", voice="en-GB-SoniaNeural")
+    assert TTSCache.key("Hello") != TTSCache.key("Hello", rate="+10%")
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_memory_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+    assert list(cache.memory) == ["a", "c"]
+    assert cache.memory_bytes == 8
+    # Still on disk, and back in memory once read
+    assert cache.get("b") == b"bbbb"
+    assert list(cache.memory) == ["c", "b"]
+
+
+def test_entry_larger_than_the_memory_tier_stays_on_disk(tmp_path):
+    cache = make_cache(tmp_path, max_memory_bytes=3)
+    cache.put("a", b"aaaa")
+    assert not cache.memory and cache.memory_bytes == 0
+    assert "a" in cache and cache.get("a") == b"aaaa"
+
+
+def test_disk_tier_evicts_least_recently_read(tmp_path):
+    cache = make_cache(tmp_path, max_memory_bytes=0, max_disk_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    os.utime(cache._path("a"), (1000, 1000))
+    os.utime(cache._path("b"), (2000, 2000))
+    cache.get("a")  # touched: now the most recently used
+    cache.put("c", b"cccc")
+    assert "b" not in cache
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    assert cache.disk_bytes == 8
+
+
+def test_overwrite_keeps_the_byte_counts(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("a", b"aaaa")
+    cache.put("a", b"aa")
+    assert (cache.memory_bytes, cache.disk_bytes) == (2, 2)
+    assert make_cache(tmp_path).disk_bytes == 2  # recounted from the directory on start
+
+
+def test_bundles_are_read_but_never_evicted(tmp_path):
+    bundle = tmp_path / "bundle"
+    bundle.mkdir()
+    (bundle / "z.mp3").write_bytes(b"zzzz")
+    cache = TTSCache(directory=str(tmp_path / "cache"), max_memory_bytes=0, max_disk_bytes=4,
+                     bundles=[str(bundle)])
+    assert "z" in cache and cache.get("z") == b"zzzz"
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert (bundle / "z.mp3").read_bytes() == b"zzzz"
+    assert not os.path.exists(cache._path("z"))
+    assert cache.get("missing") is None
@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+from app import CancelToken, TurnMachine
+
+DIALOGUE = [{"ai": "Thank you!", "user": "You are welcome.", "answers": ["you are welcome"]}]
+
+
+class FakeEngine:
+    def __init__(self, listen_forever=False):
+        self.listen_forever = listen_forever
+        self.stopped = 0
+        self.finished = 0
+        self.listening = asyncio.Event()
+
+    async def speak(self, text):
+        await asyncio.sleep(0)
+
+    async def listen(self, line, on_partial=None):
+        self.listening.set()
+        if self.listen_forever:
+            await asyncio.Event().wait()
+        return line["user"]
+
+    def check_similarity(self, user_text, line):
+        return 100
+
+    def stop_audio(self):
+        self.stopped += 1
+
+    def finish_answer(self):
+        self.finished += 1
+
+
+class FakePrefetcher:
+    def schedule(self, dialogue, step):
+        pass
+
+    def cancel(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_pauses(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay, *args: sleep(0, *args))
+
+
+def make_machine(engine):
+    return TurnMachine(engine, DIALOGUE, FakePrefetcher(), lambda state, **detail: None)
+
+
+def test_cancel_token_runs_callbacks_once():
+    token, calls = CancelToken(), []
+    token.on_cancel(lambda: calls.append("a"))
+    token.cancel()
+    token.cancel()
+    token.on_cancel(lambda: calls.append("late"))
+    assert calls == ["a", "late"]
+
+
+def test_cancel_token_remove():
+    token, calls = CancelToken(), []
+    callback = lambda: calls.append("a")
+    token.on_cancel(callback)
+    token.remove(callback)
+    token.remove(callback)
+    token.cancel()
+    assert calls == []
+
+
+def test_finished_run_does_not_cancel_its_caller():
+    engine = FakeEngine()
+
+    async def scenario():
+        machine = make_machine(engine)
+        assert await machine.run() is True
+        # What leaving the view does next: it must not cancel this (the caller's) task
+        machine.cancel()
+        await asyncio.sleep(0)
+        return machine
+
+    machine = asyncio.run(scenario())
+    assert machine.state == "complete"
+    assert (engine.stopped, engine.finished) == (0, 0)
+
+
+def test_cancel_stops_audio_and_ends_run():
+    engine = FakeEngine(listen_forever=True)
+
+    async def scenario():
+        machine = make_machine(engine)
+        task = asyncio.ensure_future(machine.run())
+        await engine.listening.wait()
+        machine.cancel()
+        return machine, await task
+
+    machine, finished = asyncio.run(scenario())
+    assert finished is False
+    assert machine.state == "cancelled"
+    assert (engine.stopped, engine.finished) == (1, 1)
+
+
+def test_outside_cancellation_propagates():
+    engine = FakeEngine(listen_forever=True)
+
+    async def scenario():
+        machine = make_machine(engine)
+        task = asyncio.ensure_future(machine.run())
+        await engine.listening.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return machine
+
+    machine = asyncio.run(scenario())
+    assert machine.state == "cancelled"
+    assert not machine.token.callbacks
+
+
+class FailingEngine(FakeEngine):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def speak(self, text):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("no route to the TTS service")
+
+
+def test_failed_handler_says_the_line_again():
+    machine = make_machine(FailingEngine(failures=1))
+    assert asyncio.run(machine.run()) is True
+    states = [event["to"] for event in machine.transitions]
+    assert states[:3] == ["speaking", "error", "speaking"]
+    assert states[-1] == "complete"
+    assert machine.transitions[1]["error"] == "RuntimeError: no route to the TTS service"
+
+
+def test_repeated_failures_end_the_conversation():
+    machine = make_machine(FailingEngine(failures=100))
+    assert asyncio.run(machine.run()) is True
+    states = [event["to"] for event in machine.transitions]
+    assert states.count("error") == app.TURN_MAX_ERRORS
+    assert states[-1] == "failed"
+
+
+def test_turn_log_has_transcript_and_score(tmp_path, monkeypatch):
+    path = tmp_path / "turns.jsonl"
+    monkeypatch.setattr(app, "TURN_LOG", str(path))
+    monkeypatch.setattr(app, "turn_log", None)
+    machine = TurnMachine(FakeEngine(), DIALOGUE, FakePrefetcher(), lambda state, **detail: None,
+                          session="s1", scenario="thanks")
+    asyncio.run(machine.run())
+    app.turn_log.close()
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    scored = [event for event in events if event["to"] == "scored"]
+    assert scored and scored[0]["text"] == "You are welcome." and scored[0]["score"] == 100
+    assert {(event["session"], event["scenario"]) for event in events} == {("s1", "thanks")}
@@ -0,0 +1,177 @@
+import asyncio
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+import web_server
+from web_server import InboxFull, RecordingInbox, tts_url
+
+BLOB = "blob:http://127.0.0.1:8550/1b0b4575-95a7-9d3c"
+KEY = "ab" * 32
+
+
+def test_inbox_upload_before_claim():
+    async def scenario():
+        inbox = RecordingInbox()
+        upload = asyncio.ensure_future(inbox.wait_for_claim(BLOB, timeout=1))
+        await asyncio.sleep(0)
+        claim = asyncio.ensure_future(inbox.take(BLOB, timeout=1))
+        assert await upload is True
+        inbox.put(BLOB, b"RIFF")
+        return await claim, inbox.claims, inbox.waiting
+
+    assert asyncio.run(scenario()) == (b"RIFF", {}, {})
+
+
+def test_inbox_claim_before_upload():
+    async def scenario():
+        inbox = RecordingInbox()
+        claim = asyncio.ensure_future(inbox.take(BLOB, timeout=1))
+        await asyncio.sleep(0)
+        assert await inbox.wait_for_claim(BLOB, timeout=0) is True
+        inbox.put(BLOB, b"RIFF")
+        return await claim, inbox.claims
+
+    assert asyncio.run(scenario()) == (b"RIFF", {})
+
+
+def test_inbox_claim_times_out():
+    async def scenario():
+        inbox = RecordingInbox()
+        with pytest.raises(RuntimeError):
+            await inbox.take(BLOB, timeout=0.01)
+        return inbox.claims
+
+    assert asyncio.run(scenario()) == {}
+
+
+def test_inbox_refuses_unclaimed_uploads():
+    async def scenario():
+        inbox = RecordingInbox()
+        claimed = await inbox.wait_for_claim(BLOB, timeout=0.01)
+        inbox.put(BLOB, b"RIFF")
+        return claimed, inbox.claims, inbox.waiting
+
+    assert asyncio.run(scenario()) == (False, {}, {})
+
+
+def test_inbox_limits_waiting_uploads():
+    async def scenario():
+        inbox = RecordingInbox(max_waiting=1)
+        first = asyncio.ensure_future(inbox.wait_for_claim(BLOB, timeout=1))
+        await asyncio.sleep(0)
+        with pytest.raises(InboxFull):
+            await inbox.wait_for_claim(BLOB + "0", timeout=1)
+        first.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_inbox_limits_bytes_in_flight():
+    inbox = RecordingInbox(max_bytes=10)
+    inbox.reserve(8)
+    with pytest.raises(InboxFull):
+        inbox.reserve(4)
+    inbox.release(8)
+    inbox.reserve(10)
+
+
+@pytest.mark.parametrize("page_url, expected", [
+    ("ws://127.0.0.1:8550", f"http://127.0.0.1:8550/tts/{KEY}.mp3"),
+    ("wss://school.example/english", f"https://school.example/english/tts/{KEY}.mp3"),
+    (None, f"/tts/{KEY}.mp3"),
+])
+def test_tts_url(page_url, expected):
+    assert tts_url(page_url, KEY) == expected
+
+
+@pytest.fixture
+def client():
+    pytest.importorskip("flet_web")
+    from fastapi.testclient import TestClient
+
+    async def session(page):
+        pass
+
+    inbox = RecordingInbox()
+    app = web_server.create_app(session, inbox, {KEY: b"ID3"}.get)
+    # Entered, so every request and inbox call runs on the one event loop of the portal
+    with TestClient(app) as http:
+        yield http, inbox
+    shutil.rmtree(app.state.generated_assets_dir)
+
+
+def test_page_gets_the_upload_script(client):
+    http, _ = client
+    response = http.get("/")
+    assert response.status_code == 200
+    assert "answers?blob=" in response.text
+    assert "flet-websocket-endpoint-path" in response.text
+
+
+def test_upload_answer(client):
+    http, inbox = client
+    claim = http.portal.start_task_soon(inbox.take, BLOB)
+    response = http.post("/answers", params={"blob": BLOB}, content=b"RIFFdata",
+                         headers={"Content-Type": "audio/wav"})
+    assert response.status_code == 204
+    assert claim.result(timeout=1) == b"RIFFdata"
+    assert inbox.held == 0
+
+
+def test_upload_nobody_claims_is_refused(client, monkeypatch):
+    http, inbox = client
+    monkeypatch.setattr(web_server, "ANSWER_CLAIM_WAIT", 0.01)
+    assert http.post("/answers", params={"blob": BLOB}, content=b"RIFFdata").status_code == 404
+    assert not inbox.claims and not inbox.waiting
+
+
+def test_upload_rejects_other_urls_and_large_bodies(client, monkeypatch):
+    http, inbox = client
+    assert http.post("/answers", params={"blob": "http://evil/x"}, content=b"x").status_code == 400
+    monkeypatch.setattr(web_server, "MAX_ANSWER_BYTES", 4)
+    assert http.post("/answers", params={"blob": BLOB}, content=b"RIFFdata").status_code == 413
+    assert not inbox.waiting and inbox.held == 0
+
+
+def test_upload_over_the_inbox_limit(client):
+    http, inbox = client
+    inbox.max_bytes = 4
+    claim = http.portal.start_task_soon(inbox.take, BLOB, 0.5)
+    assert http.post("/answers", params={"blob": BLOB}, content=b"RIFFdata").status_code == 503
+    assert inbox.held == 0
+    with pytest.raises(RuntimeError):
+        claim.result(timeout=1)
+
+
+def test_tts_route(client):
+    http, _ = client
+    response = http.get(f"/tts/{KEY}.mp3")
+    assert response.status_code == 200
+    assert response.content == b"ID3"
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert "immutable" in response.headers["cache-control"]
+    assert http.get(f"/tts/{'0' * 64}.mp3").status_code == 404
+    assert http.get(f"/tts/{KEY}.wav").status_code == 404
+
+
+def test_failed_synthesis_reaches_the_turn_as_an_error(monkeypatch):
+    import app
+
+    async def synthesize(text):
+        raise OSError("TTS service unreachable")
+
+    monkeypatch.setattr(app, "TURN_MAX_ERRORS", 1)
+    page = SimpleNamespace(overlay=[], update=lambda: None, url="ws://127.0.0.1:8550")
+    services = SimpleNamespace(synthesize=synthesize, tts_cache={})
+    engine = app.WebEnglishAI(page, services, RecordingInbox())
+    dialogue = [{"ai": "Hello!", "user": "Hi.", "answers": ["hi"]}]
+    machine = app.TurnMachine(engine, dialogue, SimpleNamespace(cancel=lambda: None),
+                              lambda state, **detail: None)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay, *args: sleep(0, *args))
+    assert asyncio.run(machine.run()) is True
+    error = next(event for event in machine.transitions if event["to"] == "error")
+    assert "TTS service unreachable" in error["error"]
+    assert machine.state == "failed"
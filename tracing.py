@@ -0,0 +1,124 @@
+"""Lightweight latency tracing for the conversation loop.
+
+Code marks stages with `with tracer.span("stt.transcribe"):`. When tracing is off, span()
+returns one shared no-op context manager, so instrumented code pays a function call and
+nothing else. When on, each finished span is kept in a per-stage rolling window (for
+p50/p95), optionally appended to a JSONL file and exposed as Prometheus text.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import threading
+import time
+
+import numpy as np
+
+_NULL_SPAN = contextlib.nullcontext()
+# Attributes (session, scenario) attached to every span recorded in the current task
+_context = contextvars.ContextVar("trace_context", default={})
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attrs", "start")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, duration, self.attrs)
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled=False, jsonl_path=None, window=500):
+        self.enabled = enabled or bool(jsonl_path)
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.totals = collections.defaultdict(lambda: [0, 0.0])  # stage -> [count, sum of seconds]
+        self.jsonl_path = jsonl_path
+        self.jsonl = None  # opened by the first record, not when the tracer is built
+        self.gauges = {}  # name -> (callable read at export time, help text)
+
+    def bind(self, **attrs):
+        """Adds attributes (e.g. session, scenario) to every span of the current task and its children."""
+        _context.set({**_context.get(), **attrs})
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, {**_context.get(), **attrs})
+
+    def record(self, name, duration, attrs=None):
+        """Records a stage duration measured elsewhere (e.g. a time-to-first-audio)."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.samples[name].append(duration)
+            totals = self.totals[name]
+            totals[0] += 1
+            totals[1] += duration
+        if self.jsonl_path:
+            if self.jsonl is None:
+                self.jsonl = open(self.jsonl_path, "a", buffering=1, encoding="utf-8")
+            event = {"ts": time.time(), "span": name, "ms": round(duration * 1000, 2)}
+            event.update(attrs or _context.get())
+            self.jsonl.write(json.dumps(event) + "\n")
+
+    def gauge(self, name, read, help_text=""):
+        """Registers a value sampled at export time (e.g. a queue depth) as english_ai_<name>."""
+        self.gauges[name] = (read, help_text)
+
+    def stats(self):
+        """{stage: {"p50", "p95", "count"}} over the rolling window, in seconds."""
+        with self.lock:
+            windows = {name: list(values) for name, values in self.samples.items() if values}
+            counts = {name: self.totals[name][0] for name in windows}
+        return {
+            name: {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+                   "count": counts[name]}
+            for name, values in sorted(windows.items())
+        }
+
+    def prometheus_text(self):
+        """Stage latencies in the Prometheus text exposition format (a summary per stage)."""
+        lines = ["# HELP english_ai_stage_seconds Latency of each conversation stage.",
+                 "# TYPE english_ai_stage_seconds summary"]
+        stats = self.stats()
+        with self.lock:
+            totals = {name: list(self.totals[name]) for name in stats}
+        for name, stat in stats.items():
+            for quantile in ("0.5", "0.95"):
+                value = stat["p50"] if quantile == "0.5" else stat["p95"]
+                lines.append(f'english_ai_stage_seconds{{stage="{name}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'english_ai_stage_seconds_count{{stage="{name}"}} {totals[name][0]}')
+            lines.append(f'english_ai_stage_seconds_sum{{stage="{name}"}} {totals[name][1]:.6f}')
+        for name, (read, help_text) in self.gauges.items():
+            lines.append(f"# HELP english_ai_{name} {help_text or name}")
+            lines.append(f"# TYPE english_ai_{name} gauge")
+            lines.append(f"english_ai_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    async def serve_metrics(self, port, host="127.0.0.1"):
+        """Serves prometheus_text() at http://host:port/metrics from the running event loop."""
+        from aiohttp import web
+
+        async def metrics(request):
+            return web.Response(text=self.prometheus_text(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
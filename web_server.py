@@ -0,0 +1,194 @@
+"""HTTP side of server mode (python app.py --serve).
+
+The Flet web app is mounted on a FastAPI app that also serves:
+
+    POST /answers?blob=<blob: URL>   a finished browser recording, uploaded by the page itself
+    GET  /tts/<cache key>.mp3        a synthesized line, straight from the TTS cache
+
+Browsers keep AudioRecorder results as in-tab blob: URLs that the server cannot read, so the
+page gets a small script that uploads every audio blob it turns into such a URL. The session
+then claims the upload by the URL the recorder reported; uploads no session claims are refused
+unread.
+"""
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+
+# Added to the page's <head>: posts every audio blob the page makes an object URL for (the
+# recorder's WAV, on stop) to /answers
+ANSWER_UPLOAD_SCRIPT = """<script>
+  (function () {
+    // AudioRecorder answers become blob: URLs only this tab can read; upload them so the
+    // server can claim them by that URL
+    var createObjectURL = URL.createObjectURL;
+    URL.createObjectURL = function (object) {
+      var url = createObjectURL.apply(this, arguments);
+      if (object instanceof Blob && object.type.indexOf("audio/") === 0) {
+        var target = new URL("answers?blob=" + encodeURIComponent(url), document.baseURI);
+        fetch(target, {method: "POST", body: object, headers: {"Content-Type": object.type}})
+          .catch(function (e) { console.error("Answer upload failed", e); });
+      }
+      return url;
+    };
+  })();
+</script>
+"""
+MAX_ANSWER_BYTES = 16 * 1024 * 1024
+# An upload is read only once a session claims its URL, and refused if none does in this many seconds
+ANSWER_CLAIM_WAIT = 10.0
+# Limits across all sessions: uploads waiting for their claim, and bytes of claimed ones in flight
+MAX_WAITING_UPLOADS = 32
+MAX_INBOX_BYTES = 64 * 1024 * 1024
+TTS_PATH = re.compile(r"^[0-9a-f]{64}$")
+
+
+class InboxFull(RuntimeError):
+    """Raised to an upload when the inbox is at one of its limits."""
+
+
+class RecordingInbox:
+    """Uploaded recordings, handed to the session that claims them by their blob: URL.
+
+    The upload and the claim race each other (the page starts uploading as soon as the
+    recording stops, while the session is still being told where it is). An upload waits
+    unread until a live session claims its URL, so nothing is stored for recordings no
+    session asked for; blob: URLs carry a random UUID, so only the tab's own session knows
+    them. Lives on the server's event loop.
+    """
+    def __init__(self, max_waiting=MAX_WAITING_UPLOADS, max_bytes=MAX_INBOX_BYTES):
+        self.max_waiting = max_waiting
+        self.max_bytes = max_bytes
+        self.claims = {}   # blob URL -> future of the uploaded bytes, made by take()
+        self.waiting = {}  # blob URL -> event set when a session claims it
+        self.held = 0      # bytes of claimed uploads being received
+
+    async def wait_for_claim(self, url, timeout=ANSWER_CLAIM_WAIT):
+        """True once a session has claimed url; False if none does within timeout."""
+        if url in self.claims:
+            return True
+        if url in self.waiting:
+            return False  # the same recording uploaded twice
+        if len(self.waiting) >= self.max_waiting:
+            raise InboxFull("too many uploads waiting for their session")
+        event = self.waiting[url] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            del self.waiting[url]
+
+    def reserve(self, size):
+        """Accounts for size more bytes of a claimed upload; release() them once it is handed over."""
+        if self.held + size > self.max_bytes:
+            raise InboxFull("too many recordings in flight")
+        self.held += size
+
+    def release(self, size):
+        self.held -= size
+
+    def put(self, url, data):
+        future = self.claims.get(url)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    async def take(self, url, timeout=10.0):
+        """Bytes uploaded for url, waiting up to timeout seconds for them to arrive."""
+        future = self.claims[url] = asyncio.get_running_loop().create_future()
+        if url in self.waiting:
+            self.waiting[url].set()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"the browser did not upload the recording {url} within {timeout:.0f}s")
+        finally:
+            if self.claims.get(url) is future:
+                del self.claims[url]
+
+
+def tts_url(page_url, key):
+    """Where the browser fetches a cached line. Absolute, because Flet resolves relative audio
+    sources against its assets directory; page_url is Flet's page.url (ws:// on this server)."""
+    base = re.sub(r"^ws(s?)://", r"http\1://", page_url or "").rstrip("/")
+    return f"{base}/tts/{key}.mp3"
+
+
+def write_web_assets(directory):
+    """Writes Flet's index.html with ANSWER_UPLOAD_SCRIPT added, as an assets_dir for the app."""
+    from flet_web import get_package_web_dir
+    with open(os.path.join(get_package_web_dir(), "index.html"), encoding="utf-8") as f:
+        index = f.read()
+    if "</head>" not in index:
+        raise RuntimeError("unexpected Flet index.html: no </head> to add the upload script to")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as f:
+        f.write(index.replace("</head>", ANSWER_UPLOAD_SCRIPT + "</head>", 1))
+    return directory
+
+
+def create_app(session_handler, inbox, tts_audio, assets_dir=None):
+    """FastAPI app serving the Flet app plus the answer upload and TTS routes.
+
+    tts_audio(key) returns the cached mp3 bytes for a TTSCache key, or None.
+    """
+    try:
+        import flet_web.fastapi as flet_fastapi
+        from fastapi import HTTPException, Request, Response
+        from flet.core.types import WebRenderer
+    except ImportError:
+        raise RuntimeError("--serve needs: pip install flet-web (the same version as flet)")
+
+    app = flet_fastapi.FastAPI()
+    app.state.generated_assets_dir = None
+    if assets_dir is None:
+        assets_dir = write_web_assets(tempfile.mkdtemp(prefix="english-ai-web-"))
+        app.state.generated_assets_dir = assets_dir
+
+    @app.post("/answers", status_code=204)
+    async def upload_answer(request: Request, blob: str):
+        if not blob.startswith("blob:"):
+            raise HTTPException(400, "expected a blob: URL")
+        if int(request.headers.get("content-length") or 0) > MAX_ANSWER_BYTES:
+            raise HTTPException(413, "recording too large")
+        data = bytearray()
+        try:
+            if not await inbox.wait_for_claim(blob, ANSWER_CLAIM_WAIT):
+                raise HTTPException(404, "no session is waiting for this recording")
+            async for chunk in request.stream():
+                if len(data) + len(chunk) > MAX_ANSWER_BYTES:
+                    raise HTTPException(413, "recording too large")
+                inbox.reserve(len(chunk))
+                data += chunk
+            inbox.put(blob, bytes(data))
+        except InboxFull as e:
+            raise HTTPException(503, str(e))
+        finally:
+            inbox.release(len(data))
+
+    @app.get("/tts/{name}")
+    async def tts_line(name: str):
+        key, _, extension = name.partition(".")
+        data = tts_audio(key) if extension == "mp3" and TTS_PATH.match(key) else None
+        if data is None:
+            raise HTTPException(404, "no such line")
+        # Content-addressed: a key always names the same audio
+        return Response(data, media_type="audio/mpeg",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+    # Registered last: the Flet app answers every path the routes above do not
+    app.mount("/", flet_fastapi.app(session_handler, assets_dir=os.path.abspath(assets_dir),
+                                    web_renderer=WebRenderer.AUTO))
+    return app
+
+
+def serve(app, host, port):
+    """Runs the app with uvicorn until interrupted, then removes its generated assets."""
+    import uvicorn
+    try:
+        uvicorn.run(app, host=host, port=port)
+    finally:
+        if app.state.generated_assets_dir:
+            shutil.rmtree(app.state.generated_assets_dir, ignore_errors=True)